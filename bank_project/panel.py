@@ -1,7 +1,12 @@
 import os
+import sys
 from flask import Flask, request, render_template, redirect, url_for, flash, send_from_directory
 from werkzeug.utils import secure_filename
 
+# Корень проекта, чтобы импортировать services/ и database/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.panel_api import register_api
+
 # Инициализация Flask приложения
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Ключ для безопасной работы с flash-сообщениями
@@ -9,6 +14,9 @@ app.secret_key = 'your_secret_key'  # Ключ для безопасной ра
 UPLOAD_FOLDER = 'uploads'  # Папка для загружаемых файлов
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# JSON/NDJSON API для запросов к хранилищу (/api/...)
+register_api(app)
+
 # Создаем папку для загрузок, если она не существует
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
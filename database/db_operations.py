@@ -2,6 +2,9 @@ from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+from database import models, partitioning, versions
+from database.models import record_changes, record_entity_change
+from utils.config import DB_PATH, PARTITION_TRANSACTIONS
 
 # Создаем базовый класс для моделей
 Base = declarative_base()
@@ -46,6 +49,52 @@ class Transaction(Base):
     account = relationship("Account", back_populates="transactions")
 
 
+# Подключение и создание схемы хранилища
+def get_engine(db_url: str = DB_PATH):
+    """
+    Создает движок базы данных.
+    """
+    return create_engine(db_url)
+
+
+def get_session(engine):
+    """
+    Создает сессию базы данных.
+    """
+    return sessionmaker(bind=engine)()
+
+
+def create_database(engine):
+    """
+    Создает таблицы хранилища (database/models.py) и учет версий таблиц.
+    При PARTITION_TRANSACTIONS включает секционирование credit_transactions:
+    в PostgreSQL создает секционированную таблицу (существующая обычная таблица
+    преобразуется), в SQLite переносит строки основной таблицы в помесячные секции.
+    """
+    if PARTITION_TRANSACTIONS and engine.dialect.name == "postgresql":
+        partitioning.create_partitioned_transactions_table(engine)
+
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        models.upgrade_change_log(connection)
+        rating_columns_added = models.upgrade_rating_schema(connection)
+    if rating_columns_added:
+        session = get_session(engine)
+        try:
+            models.recalculate_rating_aggregates(session)
+        finally:
+            session.close()
+
+    if PARTITION_TRANSACTIONS and engine.dialect.name == "sqlite":
+        session = get_session(engine)
+        try:
+            partitioning.migrate_existing_transactions(session)
+        finally:
+            session.close()
+
+    versions.install_version_tracking(engine)
+
+
 # Методы для работы с базой данных
 def add_customer(session, name: str, email: str, phone: str):
     """
@@ -53,6 +102,7 @@ def add_customer(session, name: str, email: str, phone: str):
     """
     customer = Customer(name=name, email=email, phone=phone)
     session.add(customer)
+    record_entity_change(session, customer, "insert")
     session.commit()
     return customer
 
@@ -77,6 +127,7 @@ def add_account(session, customer_id: int):
     """
     account = Account(customer_id=customer_id)
     session.add(account)
+    record_entity_change(session, account, "insert")
     session.commit()
     return account
 
@@ -99,6 +150,8 @@ def deposit(session, account_id: int, amount: float):
     account.balance += amount
     transaction = Transaction(account_id=account_id, amount=amount, type='deposit')
     session.add(transaction)
+    record_entity_change(session, account, "update")
+    record_entity_change(session, transaction, "insert")
     session.commit()
     return account.balance
 
@@ -116,6 +169,8 @@ def withdraw(session, account_id: int, amount: float):
     account.balance -= amount
     transaction = Transaction(account_id=account_id, amount=-amount, type='withdraw')
     session.add(transaction)
+    record_entity_change(session, account, "update")
+    record_entity_change(session, transaction, "insert")
     session.commit()
     return account.balance
 
@@ -140,6 +195,10 @@ def transfer(session, from_account_id: int, to_account_id: int, amount: float):
 
     session.add(transaction_out)
     session.add(transaction_in)
+    record_entity_change(session, from_account, "update")
+    record_entity_change(session, to_account, "update")
+    record_entity_change(session, transaction_out, "insert")
+    record_entity_change(session, transaction_in, "insert")
     session.commit()
     return from_account.balance, to_account.balance
 
@@ -151,6 +210,18 @@ def get_transactions_by_account(session, account_id: int):
     return session.query(Transaction).filter_by(account_id=account_id).all()
 
 
+def _delete_account_transactions(session, account_id: int):
+    """
+    Удаляет все транзакции счета и записывает удаления в журнал изменений.
+    """
+    transaction_ids = session.query(Transaction.id).filter_by(account_id=account_id).all()
+    record_changes(
+        session, Transaction.__tablename__, "delete",
+        [{"id": row.id} for row in transaction_ids], ["id"]
+    )
+    session.query(Transaction).filter_by(account_id=account_id).delete()
+
+
 def delete_customer(session, customer_id: int):
     """
     Удаляет клиента и его счета.
@@ -161,9 +232,11 @@ def delete_customer(session, customer_id: int):
 
     # Удаляем связанные счета и транзакции
     for account in customer.accounts:
-        session.query(Transaction).filter_by(account_id=account.id).delete()
+        _delete_account_transactions(session, account.id)
+        record_entity_change(session, account, "delete")
         session.delete(account)
 
+    record_entity_change(session, customer, "delete")
     session.delete(customer)
     session.commit()
 
@@ -176,7 +249,8 @@ def delete_account(session, account_id: int):
     if not account:
         raise ValueError("Счет не найден")
 
-    session.query(Transaction).filter_by(account_id=account.id).delete()
+    _delete_account_transactions(session, account.id)
+    record_entity_change(session, account, "delete")
     session.delete(account)
     session.commit()
 
@@ -196,5 +270,6 @@ def update_customer_info(session, customer_id: int, name: str = None, email: str
     if phone:
         customer.phone = phone
 
+    record_entity_change(session, customer, "update")
     session.commit()
     return customer
\ No newline at end of file
@@ -1,6 +1,13 @@
+import json
+import math
+import numbers
+from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, Float, Date, Boolean, ForeignKey, Text
+    Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text,
+    UniqueConstraint, bindparam, inspect, select, text, update
 )
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -34,6 +41,31 @@ class CreditProduct(Base):
     CollateralRequired = Column(Boolean, nullable=False)
     Description = Column(Text, nullable=True)  # Новое поле
 
+    # Поддерживаемые агрегаты рейтингов (обновляются rate_product / bulk_rate_products)
+    RatingCount = Column(Integer, nullable=False, default=0, server_default="0")
+    RatingSum = Column(Integer, nullable=False, default=0, server_default="0")
+    Rating1Count = Column(Integer, nullable=False, default=0, server_default="0")
+    Rating2Count = Column(Integer, nullable=False, default=0, server_default="0")
+    Rating3Count = Column(Integer, nullable=False, default=0, server_default="0")
+    Rating4Count = Column(Integer, nullable=False, default=0, server_default="0")
+    Rating5Count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    @property
+    def AverageRating(self):
+        """
+        Средний рейтинг продукта (None, если оценок нет).
+        """
+        if not self.RatingCount:
+            return None
+        return self.RatingSum / self.RatingCount
+
+    @property
+    def RatingHistogram(self):
+        """
+        Гистограмма оценок: {оценка: количество}.
+        """
+        return {rating: getattr(self, f"Rating{rating}Count") or 0 for rating in range(1, 6)}
+
     agreements = relationship("CreditAgreement", back_populates="credit_product")
     product_ratings = relationship("ProductRating", back_populates="credit_product")  # Новое
 
@@ -94,6 +126,9 @@ class CustomerComplaint(Base):
 # Рейтинги кредитных продуктов
 class ProductRating(Base):
     __tablename__ = "product_ratings"
+    __table_args__ = (
+        UniqueConstraint("CustomerID", "CreditProductID", name="uq_product_ratings_customer_product"),
+    )
 
     RatingID = Column(Integer, primary_key=True)
     CreditProductID = Column(Integer, ForeignKey("credit_products.CreditProductID"), nullable=False)
@@ -104,7 +139,186 @@ class ProductRating(Base):
     credit_product = relationship("CreditProduct", back_populates="product_ratings")
     customer = relationship("Customer")  # Односторонняя связь
 
+# Журнал изменений (outbox) для инкрементальной синхронизации внешних систем
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    # AUTOINCREMENT в SQLite: ChangeID не переиспользуются после purge_changes
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    ChangeID = Column(Integer, primary_key=True, autoincrement=True)  # Монотонное смещение
+    TableName = Column(String, nullable=False, index=True)
+    Operation = Column(String, nullable=False)  # insert, update, delete, truncate
+    PrimaryKey = Column(String, nullable=True)  # JSON значения первичного ключа
+    Payload = Column(Text, nullable=True)  # JSON строки после изменения
+    ChangedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Смещения потребителей журнала изменений
+class ChangeConsumerOffset(Base):
+    __tablename__ = "change_consumer_offsets"
+
+    ConsumerName = Column(String, primary_key=True)
+    LastChangeID = Column(Integer, nullable=False, default=0)
+    UpdatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Версии таблиц для ETag / Last-Modified панели (увеличиваются триггерами, см. database/versions.py)
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    TableName = Column(String, primary_key=True)
+    Version = Column(Integer, nullable=False, default=0)
+    UpdatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 # Методы для удобной работы с новыми данными
+RATING_KEY = ("CustomerID", "CreditProductID")
+
+# Ключ транзакционной advisory-блокировки журнала изменений в PostgreSQL
+CHANGE_LOG_LOCK_KEY = 7300230
+
+
+def _json_value(value):
+    # Скаляры numpy/pandas (строки из CSV) приводим к встроенным типам Python
+    if hasattr(value, "item") and callable(value.item):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _to_json(data) -> Optional[str]:
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        data = {key: _json_value(value) for key, value in data.items()}
+    return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def entity_to_dict(entity) -> Dict[str, Any]:
+    """
+    Возвращает значения колонок ORM-объекта в виде словаря.
+    """
+    return {column.key: getattr(entity, column.key) for column in entity.__table__.columns}
+
+
+def _lock_change_log(executor):
+    """
+    Упорядочивает ChangeID по коммитам. В PostgreSQL номера последовательности
+    могут фиксироваться не по порядку, и потребитель мог бы пропустить изменение
+    незавершенной транзакции с меньшим ChangeID. Транзакционная advisory-блокировка
+    держится до коммита, поэтому пишущие транзакции получают ChangeID и коммитятся
+    по очереди. SQLite и так допускает только одного писателя.
+    :param executor: Сессия или соединение.
+    """
+    dialect = executor.dialect if hasattr(executor, "dialect") else executor.get_bind().dialect
+    if dialect.name == "postgresql":
+        executor.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY})
+
+
+def upgrade_change_log(connection):
+    """
+    Пересоздает change_log SQLite, созданный без AUTOINCREMENT, сохраняя записи.
+    Идемпотентна.
+    :param connection: Соединение с базой данных.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    sql = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'change_log'"
+    )).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    connection.execute(text('ALTER TABLE change_log RENAME TO change_log_old'))
+    connection.execute(text('DROP INDEX IF EXISTS "ix_change_log_TableName"'))
+    ChangeLog.__table__.create(connection)
+    columns = ", ".join(f'"{column.name}"' for column in ChangeLog.__table__.columns)
+    connection.execute(text(f'INSERT INTO change_log ({columns}) SELECT {columns} FROM change_log_old'))
+    connection.execute(text('DROP TABLE change_log_old'))
+
+
+def record_changes(
+    session,
+    table_name: str,
+    operation: str,
+    rows: Iterable[Dict[str, Any]],
+    primary_key: Sequence[str]
+):
+    """
+    Записывает изменения строк в журнал одним INSERT (executemany) в текущей транзакции.
+    Коммит выполняет вызывающий код, поэтому запись в журнал атомарна с самим изменением.
+    :param session: Сессия базы данных.
+    :param table_name: Имя измененной таблицы.
+    :param operation: insert, update, delete или truncate.
+    :param rows: Словари со значениями колонок.
+    :param primary_key: Имена колонок первичного ключа.
+    """
+    now = datetime.utcnow()
+    entries = [
+        {
+            "TableName": table_name,
+            "Operation": operation,
+            "PrimaryKey": _to_json([_json_value(row.get(column)) for column in primary_key]),
+            "Payload": _to_json(None if operation == "delete" else row),
+            "ChangedAt": now,
+        }
+        for row in rows
+    ]
+    if entries:
+        _lock_change_log(session)
+        session.execute(ChangeLog.__table__.insert(), entries)
+
+
+def record_change(session, table_name: str, operation: str, primary_key: Sequence[Any] = None, data=None):
+    """
+    Записывает одно изменение в журнал (для операций без конкретной строки, например truncate).
+    :param session: Сессия базы данных.
+    :param table_name: Имя измененной таблицы.
+    :param operation: insert, update, delete или truncate.
+    :param primary_key: Значения первичного ключа.
+    :param data: Значения колонок после изменения.
+    """
+    _lock_change_log(session)
+    session.execute(ChangeLog.__table__.insert(), [{
+        "TableName": table_name,
+        "Operation": operation,
+        "PrimaryKey": _to_json(list(primary_key)) if primary_key is not None else None,
+        "Payload": _to_json(data),
+        "ChangedAt": datetime.utcnow(),
+    }])
+
+
+def record_table_deletes(connection, table_name: str, source: str, key_column: str):
+    """
+    Записывает в журнал удаление всех строк физической таблицы одним INSERT ... SELECT
+    (например, при отсоединении секции, когда строки не проходят через Python).
+    :param connection: Соединение с базой данных (в транзакции удаления).
+    :param table_name: Имя таблицы в журнале.
+    :param source: Физическая таблица, строки которой удаляются.
+    :param key_column: Колонка первичного ключа (одна).
+    """
+    _lock_change_log(connection)
+    connection.execute(text(
+        'INSERT INTO change_log ("TableName", "Operation", "PrimaryKey", "Payload", "ChangedAt") '
+        f"SELECT :table_name, 'delete', '[' || CAST(\"{key_column}\" AS TEXT) || ']', NULL, :changed_at "
+        f'FROM "{source}" ORDER BY "{key_column}"'
+    ).bindparams(bindparam("changed_at", type_=DateTime)), {"table_name": table_name, "changed_at": datetime.utcnow()})
+
+
+def record_entity_change(session, entity, operation: str, primary_key: Sequence[str] = None):
+    """
+    Записывает изменение ORM-объекта в журнал. Для вставок объект предварительно
+    сбрасывается в БД, чтобы получить автоинкрементный первичный ключ.
+    :param session: Сессия базы данных.
+    :param entity: ORM-объект (любой декларативной модели).
+    :param operation: insert, update или delete.
+    :param primary_key: Колонки ключа для журнала (по умолчанию первичный ключ таблицы).
+    """
+    if operation != "delete":
+        session.flush()
+    table = entity.__table__
+    if primary_key is None:
+        primary_key = [column.key for column in table.primary_key.columns]
+    record_changes(session, table.name, operation, [entity_to_dict(entity)], primary_key)
+
+
 def add_complaint(session, customer_id: int, complaint_text: str):
     """
     Добавляет жалобу клиента.
@@ -115,6 +329,7 @@ def add_complaint(session, customer_id: int, complaint_text: str):
         ComplaintText=complaint_text
     )
     session.add(complaint)
+    record_entity_change(session, complaint, "insert")
     session.commit()
     return complaint
 
@@ -127,21 +342,58 @@ def resolve_complaint(session, complaint_id: int):
         raise ValueError("Жалоба не найдена")
 
     complaint.Status = "Closed"
+    record_entity_change(session, complaint, "update")
     session.commit()
 
+def _validate_rating(rating) -> int:
+    """
+    Проверяет оценку: целое число от 1 до 5 (дробные и bool не допускаются).
+    :param rating: Оценка.
+    :return: Оценка как int.
+    """
+    if isinstance(rating, bool) or not isinstance(rating, numbers.Integral) or not (1 <= rating <= 5):
+        raise ValueError("Рейтинг должен быть целым числом от 1 до 5")
+    return int(rating)
+
+
+def _lock_products(session, product_ids: Iterable[int]):
+    """
+    Блокирует строки агрегатов продуктов до конца транзакции, чтобы параллельные
+    оценки не прочитали одну и ту же старую оценку и не применили дельты дважды.
+    В PostgreSQL — SELECT ... FOR UPDATE (в порядке ID, без взаимоблокировок),
+    в SQLite — пустой UPDATE, который захватывает блокировку записи до чтения.
+    :param session: Сессия базы данных.
+    :param product_ids: ID кредитных продуктов.
+    """
+    products = CreditProduct.__table__
+    product_ids = sorted(set(product_ids))
+    condition = products.c.CreditProductID.in_(product_ids)
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(
+            select(products.c.CreditProductID).where(condition)
+            .order_by(products.c.CreditProductID).with_for_update()
+        ).all()
+    else:
+        session.execute(update(products).where(condition).values(RatingCount=products.c.RatingCount))
+
+
 def rate_product(session, customer_id: int, credit_product_id: int, rating: int, review_text: str = None):
     """
     Добавляет или обновляет рейтинг кредитного продукта.
     """
-    if not (1 <= rating <= 5):
-        raise ValueError("Рейтинг должен быть от 1 до 5")
+    rating = _validate_rating(rating)
 
+    # Старая оценка читается после блокировки продукта и в обход кэша сессии
+    _lock_products(session, [credit_product_id])
     product_rating = session.query(ProductRating).filter_by(
         CustomerID=customer_id,
         CreditProductID=credit_product_id
-    ).first()
+    ).populate_existing().first()
 
+    deltas = {}
+    operation = "update" if product_rating else "insert"
     if product_rating:
+        _add_rating_delta(deltas, credit_product_id, product_rating.Rating, -1)
         product_rating.Rating = rating
         product_rating.ReviewText = review_text
     else:
@@ -152,6 +404,181 @@ def rate_product(session, customer_id: int, credit_product_id: int, rating: int,
             ReviewText=review_text
         )
         session.add(product_rating)
+    _add_rating_delta(deltas, credit_product_id, rating, 1)
 
+    _apply_rating_deltas(session, deltas)
+    # Ключ рейтинга в журнале — (CustomerID, CreditProductID), как и в bulk_rate_products
+    record_entity_change(session, product_rating, operation, RATING_KEY)
     session.commit()
     return product_rating
+
+
+RATING_AGGREGATE_COLUMNS = ["RatingCount", "RatingSum"] + [f"Rating{rating}Count" for rating in range(1, 6)]
+
+
+def upgrade_rating_schema(connection) -> bool:
+    """
+    Приводит существующую базу к схеме рейтингов: добавляет колонки агрегатов
+    в credit_products и уникальный индекс (CustomerID, CreditProductID) в product_ratings.
+    Перед созданием индекса удаляет дубли пар, оставляя последнюю оценку (max RatingID).
+    Идемпотентна.
+    :param connection: Соединение с базой данных.
+    :return: True, если колонки агрегатов были добавлены (их нужно заполнить
+             через recalculate_rating_aggregates).
+    """
+    inspector = inspect(connection)
+    added = False
+    if inspector.has_table(CreditProduct.__tablename__):
+        existing = {column["name"] for column in inspector.get_columns(CreditProduct.__tablename__)}
+        for name in RATING_AGGREGATE_COLUMNS:
+            if name not in existing:
+                connection.execute(text(
+                    f'ALTER TABLE {CreditProduct.__tablename__} ADD COLUMN "{name}" INTEGER NOT NULL DEFAULT 0'
+                ))
+                added = True
+
+    if inspector.has_table(ProductRating.__tablename__):
+        key = set(RATING_KEY)
+        unique = any(
+            set(constraint["column_names"]) == key
+            for constraint in inspector.get_unique_constraints(ProductRating.__tablename__)
+        ) or any(
+            index["unique"] and set(index["column_names"]) == key
+            for index in inspector.get_indexes(ProductRating.__tablename__)
+        )
+        if not unique:
+            connection.execute(text(
+                'DELETE FROM product_ratings WHERE "RatingID" NOT IN ('
+                'SELECT MAX("RatingID") FROM product_ratings GROUP BY "CustomerID", "CreditProductID")'
+            ))
+            connection.execute(text(
+                'CREATE UNIQUE INDEX IF NOT EXISTS uq_product_ratings_customer_product '
+                'ON product_ratings ("CustomerID", "CreditProductID")'
+            ))
+    return added
+
+
+def _add_rating_delta(deltas: dict, credit_product_id: int, rating: int, sign: int):
+    """
+    Накапливает изменение агрегатов продукта от добавления (sign=1) или удаления (sign=-1) оценки.
+    """
+    delta = deltas.setdefault(credit_product_id, {"count": 0, "sum": 0, 1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+    delta["count"] += sign
+    delta["sum"] += sign * rating
+    delta[rating] += sign
+
+
+def _apply_rating_deltas(session, deltas: dict):
+    """
+    Применяет накопленные изменения к агрегатам CreditProduct одним UPDATE (executemany).
+    """
+    params = [
+        {
+            "b_product_id": product_id,
+            "b_count": delta["count"],
+            "b_sum": delta["sum"],
+            **{f"b_rating{rating}": delta[rating] for rating in range(1, 6)},
+        }
+        for product_id, delta in deltas.items()
+        if any(delta.values())
+    ]
+    if not params:
+        return
+
+    table = CreditProduct.__table__
+    stmt = update(table).where(table.c.CreditProductID == bindparam("b_product_id")).values(
+        RatingCount=table.c.RatingCount + bindparam("b_count"),
+        RatingSum=table.c.RatingSum + bindparam("b_sum"),
+        **{
+            f"Rating{rating}Count": table.c[f"Rating{rating}Count"] + bindparam(f"b_rating{rating}")
+            for rating in range(1, 6)
+        }
+    )
+    session.execute(stmt, params)
+
+
+def bulk_rate_products(session, ratings: Iterable[Tuple[int, int, int]]) -> int:
+    """
+    Массово добавляет или обновляет рейтинги одним INSERT ... ON CONFLICT DO UPDATE
+    и инкрементально обновляет агрегаты кредитных продуктов.
+    При повторе пары (клиент, продукт) во входных данных учитывается последняя оценка.
+    :param session: Сессия базы данных.
+    :param ratings: Кортежи (CustomerID, CreditProductID, Rating).
+    :return: Количество обработанных пар (клиент, продукт).
+    """
+    latest = {}
+    for customer_id, credit_product_id, rating in ratings:
+        latest[(customer_id, credit_product_id)] = _validate_rating(rating)
+    if not latest:
+        return 0
+
+    # Старые оценки нужны для расчета изменений агрегатов; читаются под блокировкой продуктов
+    table = ProductRating.__table__
+    existing = {}
+    customer_ids = {customer_id for customer_id, _ in latest}
+    product_ids = {product_id for _, product_id in latest}
+    _lock_products(session, product_ids)
+    rows = session.execute(
+        select(table.c.CustomerID, table.c.CreditProductID, table.c.Rating)
+        .where(table.c.CustomerID.in_(customer_ids))
+        .where(table.c.CreditProductID.in_(product_ids))
+    )
+    for customer_id, credit_product_id, rating in rows:
+        if (customer_id, credit_product_id) in latest:
+            existing[(customer_id, credit_product_id)] = rating
+
+    deltas = {}
+    for (customer_id, credit_product_id), rating in latest.items():
+        if (customer_id, credit_product_id) in existing:
+            _add_rating_delta(deltas, credit_product_id, existing[(customer_id, credit_product_id)], -1)
+        _add_rating_delta(deltas, credit_product_id, rating, 1)
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise ValueError(f"Массовая загрузка рейтингов не поддерживается для {dialect}")
+
+    stmt = insert(table).values([
+        {"CustomerID": customer_id, "CreditProductID": credit_product_id, "Rating": rating}
+        for (customer_id, credit_product_id), rating in latest.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.CustomerID, table.c.CreditProductID],
+        set_={"Rating": stmt.excluded.Rating}
+    )
+    session.execute(stmt)
+    _apply_rating_deltas(session, deltas)
+    for operation in ("insert", "update"):
+        record_changes(session, table.name, operation, [
+            {"CustomerID": customer_id, "CreditProductID": credit_product_id, "Rating": rating}
+            for (customer_id, credit_product_id), rating in latest.items()
+            if ((customer_id, credit_product_id) in existing) == (operation == "update")
+        ], RATING_KEY)
+    session.commit()
+    return len(latest)
+
+
+def recalculate_rating_aggregates(session):
+    """
+    Пересчитывает агрегаты рейтингов всех продуктов по таблице product_ratings
+    (для существующих баз и после записей в обход rate_product / bulk_rate_products).
+    :param session: Сессия базы данных.
+    """
+    upgrade_rating_schema(session.connection())
+
+    products = CreditProduct.__table__
+    ratings = ProductRating.__table__
+    deltas = {}
+    rows = session.execute(select(ratings.c.CreditProductID, ratings.c.Rating))
+    for credit_product_id, rating in rows:
+        _add_rating_delta(deltas, credit_product_id, rating, 1)
+
+    session.execute(update(products).values(
+        RatingCount=0, RatingSum=0,
+        **{f"Rating{rating}Count": 0 for rating in range(1, 6)}
+    ))
+    _apply_rating_deltas(session, deltas)
+    session.commit()
@@ -0,0 +1,608 @@
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, ForeignKey, Identity, Index, Integer, MetaData, PrimaryKeyConstraint, Table, event, inspect, select,
+    text, union_all
+)
+from sqlalchemy.orm import Session, aliased
+
+from database.models import Base, CreditTransaction, TableVersion, record_change, record_changes, record_table_deletes
+from database.versions import batched_versions, bump_version, create_version_triggers, is_batched
+
+# Помесячное секционирование таблицы credit_transactions.
+# PostgreSQL: родительская таблица PARTITION BY RANGE ("TransactionDate"),
+# секции создаются как PARTITION OF, отсечение секций выполняет планировщик.
+# SQLite: отдельная таблица на каждый месяц (credit_transactions_YYYY_MM),
+# маршрутизация вставок и отсечение секций выполняются в этом модуле.
+# TransactionID в SQLite уникален во всех секциях: каждый ID регистрируется
+# в credit_transaction_ids (AUTOINCREMENT, номера не переиспользуются), а прямые
+# вставки в основную таблицу после появления секций запрещены триггером.
+# Связи Customer.transactions, CreditAgreement.transactions и
+# TransactionType.transactions читают только основную таблицу, поэтому
+# при секциях SQLite их загрузка завершается ошибкой (см. _reject_relationship_loads);
+# транзакции читаются через transactions_source.
+# Функции записи (insert/update/delete_transactions, clear_partitions,
+# detach_partition) сами пишут изменения в журнал change_log с фактическими
+# TransactionID; перенос строк основной таблицы в секции журналом не отражается.
+
+PARENT_TABLE = CreditTransaction.__tablename__
+# Размер порции ID в поиске по секциям (ограничение SQLite на число параметров)
+LOOKUP_BATCH_SIZE = 500
+PARTITION_NAME_RE = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+
+_partition_metadata = MetaData()
+
+# Общий реестр TransactionID всех секций SQLite
+transaction_ids = Table(
+    "credit_transaction_ids",
+    _partition_metadata,
+    Column("TransactionID", Integer, primary_key=True),
+    sqlite_autoincrement=True,
+)
+
+_REJECT_PARENT_INSERT = (
+    f'CREATE TRIGGER IF NOT EXISTS "trg_{PARENT_TABLE}_partitioned" '
+    f'BEFORE INSERT ON "{PARENT_TABLE}" BEGIN '
+    f"SELECT RAISE(ABORT, 'Таблица {PARENT_TABLE} секционирована: "
+    f"используйте database.partitioning.insert_transactions'); END"
+)
+
+
+def to_date(value: Any) -> date:
+    """
+    Приводит значение (date, datetime, Timestamp, строку 'YYYY-MM-DD...') к date.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def month_start(value: Any) -> date:
+    """
+    Возвращает первый день месяца для указанной даты.
+    """
+    day = to_date(value)
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    """
+    Возвращает первый день следующего месяца.
+    """
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def partition_name(month: Any) -> str:
+    """
+    Имя секции для месяца, например credit_transactions_2024_11.
+    """
+    month = month_start(month)
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def _is_postgres(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def _transactions_table(
+    name: str,
+    metadata: MetaData,
+    *extra,
+    primary_key: Tuple[str, ...] = ("TransactionID",),
+    parent: bool = False,
+    **kwargs
+) -> Table:
+    """
+    Создает описание таблицы с колонками CreditTransaction.
+    Для родительской таблицы PostgreSQL (parent=True) копируются внешние ключи,
+    а TransactionID получает identity, как SERIAL в обычной таблице.
+    """
+    columns = []
+    for column in CreditTransaction.__table__.columns:
+        items = []
+        options = {"autoincrement": False}
+        if parent:
+            items = [ForeignKey(foreign_key.column) for foreign_key in column.foreign_keys]
+            if column.name == "TransactionID":
+                items.append(Identity())
+                options = {}
+        columns.append(Column(
+            column.name,
+            column.type,
+            *items,
+            primary_key=column.name in primary_key,
+            nullable=column.nullable,
+            **options
+        ))
+    return Table(name, metadata, *columns, *extra, **kwargs)
+
+
+def partition_table(month: Any) -> Table:
+    """
+    Описание таблицы-секции SQLite для указанного месяца.
+    """
+    name = partition_name(month)
+    if name in _partition_metadata.tables:
+        return _partition_metadata.tables[name]
+    return _transactions_table(
+        name,
+        _partition_metadata,
+        Index(f"ix_{name}_CustomerID", "CustomerID"),
+        Index(f"ix_{name}_CreditAgreementID", "CreditAgreementID"),
+    )
+
+
+def _create_pg_partition(connection, month: date):
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{PARENT_TABLE}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    ))
+
+
+def create_partitioned_transactions_table(engine):
+    """
+    Создает секционированную родительскую таблицу credit_transactions в PostgreSQL.
+    Если уже есть обычная таблица credit_transactions, преобразует ее: таблица
+    переименовывается, создается секционированная, строки копируются по секциям,
+    старая таблица удаляется (все в одной транзакции). Внешние ключи сохраняются
+    (PostgreSQL 12+), счетчик identity TransactionID продолжается после максимального ID.
+    Вызывается из create_database до Base.metadata.create_all, чтобы create_all
+    не создал обычную таблицу; таблицы, на которые ссылаются внешние ключи,
+    создаются здесь. В PostgreSQL первичный ключ секционированной
+    таблицы обязан включать ключ секционирования.
+    :param engine: Движок базы данных.
+    """
+    if engine.dialect.name != "postgresql":
+        raise ValueError("Нативное секционирование поддерживается только в PostgreSQL")
+
+    legacy_table = f"{PARENT_TABLE}_legacy"
+    metadata = MetaData()
+    parent = _transactions_table(
+        PARENT_TABLE,
+        metadata,
+        PrimaryKeyConstraint("TransactionID", "TransactionDate", name=f"pk_{PARENT_TABLE}_partitioned"),
+        primary_key=(),
+        parent=True,
+        postgresql_partition_by='RANGE ("TransactionDate")',
+    )
+    referenced = [table for table in Base.metadata.sorted_tables if table is not CreditTransaction.__table__]
+
+    with engine.begin() as connection:
+        # relkind: 'p' — секционированная таблица, 'r' — обычная
+        relkind = connection.execute(text(
+            "SELECT relkind FROM pg_class WHERE relname = :name AND relkind IN ('r', 'p')"
+        ), {"name": PARENT_TABLE}).scalar()
+        if relkind == "p":
+            return
+        if relkind == "r":
+            connection.execute(text(f'ALTER TABLE "{PARENT_TABLE}" RENAME TO "{legacy_table}"'))
+
+        Base.metadata.create_all(connection, tables=referenced)
+        parent.create(connection)
+
+        if relkind == "r":
+            months = connection.execute(text(
+                f'SELECT DISTINCT date_trunc(\'month\', "TransactionDate")::date FROM "{legacy_table}"'
+            )).scalars().all()
+            for month in months:
+                _create_pg_partition(connection, month)
+            columns = ", ".join(f'"{column.name}"' for column in parent.columns)
+            connection.execute(text(
+                f'INSERT INTO "{PARENT_TABLE}" ({columns}) SELECT {columns} FROM "{legacy_table}"'
+            ))
+            connection.execute(text(f'DROP TABLE "{legacy_table}"'))
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{PARENT_TABLE}\"', 'TransactionID'), "
+                f'COALESCE(MAX("TransactionID"), 0) + 1, false) FROM "{PARENT_TABLE}"'
+            ))
+
+
+def list_partitions(session: Session) -> List[date]:
+    """
+    Возвращает отсортированный список месяцев, для которых существуют секции.
+    :param session: Сессия базы данных.
+    :return: Список дат (первые дни месяцев).
+    """
+    if _is_postgres(session):
+        names = session.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ), {"parent": PARENT_TABLE}).scalars().all()
+    else:
+        names = inspect(session.connection()).get_table_names()
+
+    months = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_partition(session: Session, month: Any) -> str:
+    """
+    Создает секцию для месяца, если она еще не существует.
+    :param session: Сессия базы данных.
+    :param month: Любая дата внутри месяца.
+    :return: Имя секции.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if _is_postgres(session):
+        _create_pg_partition(session.connection(), month)
+    else:
+        connection = session.connection()
+        inspector = inspect(connection)
+        if not inspector.has_table(name):
+            transaction_ids.create(connection, checkfirst=True)
+            partition_table(month).create(connection)
+            # Новые строки основной таблицы получили бы ID, уже занятые в секциях
+            connection.execute(text(_REJECT_PARENT_INSERT))
+            # Изменения секции увеличивают версию credit_transactions
+            # (внутри batched_versions триггеры создаются при выходе из блока)
+            if inspector.has_table(TableVersion.__tablename__) and not is_batched(connection, PARENT_TABLE):
+                create_version_triggers(connection, name, PARENT_TABLE)
+    return name
+
+
+def insert_transactions(session: Session, records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Маршрутизирует вставку транзакций по помесячным секциям и записывает вставки
+    в журнал изменений. Недостающие секции создаются автоматически. Коммит выполняет вызывающий код.
+    SQLite: ID регистрируются в credit_transaction_ids (строкам без TransactionID
+    выдаются новые), строки основной таблицы предварительно переносятся в секции.
+    PostgreSQL: строкам без TransactionID номера выдаются из identity-последовательности.
+    :param session: Сессия базы данных.
+    :param records: Записи транзакций (словари с ключами колонок CreditTransaction).
+    :return: Словарь {имя секции: количество вставленных строк}.
+    """
+    rows = _insert(session, records)
+    record_changes(session, PARENT_TABLE, "insert", rows, ["TransactionID"])
+    inserted = {}
+    for row in rows:
+        name = partition_name(row["TransactionDate"])
+        inserted[name] = inserted.get(name, 0) + 1
+    return inserted
+
+
+def _insert(session: Session, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Вставка транзакций по секциям (см. insert_transactions).
+    :return: Вставленные строки с присвоенными TransactionID.
+    """
+    records = [dict(record) for record in records]
+    if not records:
+        return records
+    with batched_versions(session.connection(), PARENT_TABLE):
+        if not _is_postgres(session):
+            # Строки, вставленные до секционирования, должны попасть в реестр ID раньше новых
+            _move_base_rows(session)
+            _reserve_ids(session, records)
+        else:
+            _reserve_pg_ids(session, records)
+        _route(session, records)
+    return records
+
+
+def _reserve_pg_ids(session: Session, records: List[Dict[str, Any]]):
+    """
+    Выдает TransactionID строкам без ID из identity-последовательности PostgreSQL,
+    чтобы вызывающий код знал ключи вставленных строк.
+    """
+    missing = [record for record in records if record.get("TransactionID") is None]
+    if not missing:
+        return
+    ids = session.execute(text(
+        f"SELECT nextval(pg_get_serial_sequence('\"{PARENT_TABLE}\"', 'TransactionID')) "
+        "FROM generate_series(1, :count)"
+    ), {"count": len(missing)}).scalars().all()
+    for record, transaction_id in zip(missing, ids):
+        record["TransactionID"] = transaction_id
+
+
+def _reserve_ids(session: Session, records: List[Dict[str, Any]]):
+    """
+    Регистрирует TransactionID в общем реестре SQLite. Повтор ID из любой секции
+    вызывает IntegrityError; строкам без ID выдаются новые номера.
+    """
+    connection = session.connection()
+    transaction_ids.create(connection, checkfirst=True)
+    explicit = [{"TransactionID": record["TransactionID"]} for record in records
+                if record.get("TransactionID") is not None]
+    if explicit:
+        session.execute(transaction_ids.insert(), explicit)
+    missing = [record for record in records if record.get("TransactionID") is None]
+    if not missing:
+        return
+    # Новые номера выдаются блоком после максимального когда-либо выданного ID
+    # (sqlite_sequence AUTOINCREMENT) и регистрируются одним executemany
+    last = session.execute(
+        text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": transaction_ids.name}
+    ).scalar() or 0
+    for offset, record in enumerate(missing, start=1):
+        record["TransactionID"] = last + offset
+    session.execute(transaction_ids.insert(), [{"TransactionID": record["TransactionID"]} for record in missing])
+
+
+def _route(session: Session, records: List[Dict[str, Any]]) -> Dict[str, int]:
+    by_month: Dict[date, List[Dict[str, Any]]] = {}
+    for record in records:
+        record["TransactionDate"] = to_date(record["TransactionDate"])
+        by_month.setdefault(month_start(record["TransactionDate"]), []).append(record)
+
+    inserted = {}
+    postgres = _is_postgres(session)
+    for month, rows in sorted(by_month.items()):
+        name = ensure_partition(session, month)
+        if postgres:
+            # Родительская таблица сама направит строки в нужную секцию
+            session.execute(CreditTransaction.__table__.insert(), rows)
+        else:
+            session.execute(partition_table(month).insert(), rows)
+        inserted[name] = len(rows)
+    return inserted
+
+
+def _transaction_tables(session: Session) -> List[Table]:
+    """
+    Физические таблицы, в которых могут находиться транзакции: в PostgreSQL —
+    родительская таблица, в SQLite — основная таблица и все секции.
+    """
+    tables = [CreditTransaction.__table__]
+    if not _is_postgres(session):
+        tables += [partition_table(month) for month in list_partitions(session)]
+    return tables
+
+
+def _batches(values: List[Any]):
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        yield values[start:start + LOOKUP_BATCH_SIZE]
+
+
+def _locate_transactions(session: Session, transaction_ids: Iterable[Any]) -> Dict[Any, Tuple[Table, Dict[str, Any]]]:
+    """
+    Находит строки транзакций по ID во всех таблицах из _transaction_tables.
+    :return: Словарь {TransactionID: (таблица, значения строки)}.
+    """
+    transaction_ids = list(dict.fromkeys(transaction_ids))
+    found = {}
+    for table in _transaction_tables(session):
+        for batch in _batches(transaction_ids):
+            rows = session.execute(select(table).where(table.c.TransactionID.in_(batch))).mappings()
+            for row in rows:
+                found[row["TransactionID"]] = (table, dict(row))
+    return found
+
+
+def update_transactions(
+    session: Session,
+    records: Iterable[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Обновляет транзакции по TransactionID с учетом секций; записи с ID, которых
+    нет в хранилище, вставляются. Изменения записываются в журнал. Коммит выполняет вызывающий код.
+    SQLite: при смене месяца TransactionDate строка переносится в другую секцию.
+    PostgreSQL: перенос между секциями выполняет СУБД.
+    :param session: Сессия базы данных.
+    :param records: Записи транзакций (словари с ключами колонок CreditTransaction).
+    :return: Кортеж (обновленные строки, вставленные строки).
+    """
+    records = [dict(record) for record in records]
+    found = _locate_transactions(
+        session, [record["TransactionID"] for record in records if record.get("TransactionID") is not None]
+    )
+
+    postgres = _is_postgres(session)
+    updated, moved, new = [], [], []
+    with batched_versions(session.connection(), PARENT_TABLE):
+        for record in records:
+            key = record.get("TransactionID")
+            if key is None or key not in found:
+                new.append(record)
+                continue
+            table, row = found[key]
+            row.update({name: value for name, value in record.items() if name in table.c})
+            row["TransactionDate"] = to_date(row["TransactionDate"])
+            if postgres:
+                ensure_partition(session, row["TransactionDate"])
+            elif table is not CreditTransaction.__table__ and partition_table(row["TransactionDate"]) is not table:
+                # ID уже зарегистрирован в credit_transaction_ids, поэтому строка только перемещается
+                session.execute(table.delete().where(table.c.TransactionID == key))
+                moved.append(row)
+                updated.append(row)
+                continue
+            session.execute(table.update().where(table.c.TransactionID == key).values(**row))
+            updated.append(row)
+
+        if moved:
+            _route(session, moved)
+        inserted = _insert(session, new)
+    record_changes(session, PARENT_TABLE, "update", updated, ["TransactionID"])
+    record_changes(session, PARENT_TABLE, "insert", inserted, ["TransactionID"])
+    return updated, inserted
+
+
+def delete_transactions(session: Session, transaction_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Удаляет транзакции по ID из всех секций и записывает удаления в журнал.
+    Коммит выполняет вызывающий код.
+    ID удаленных строк SQLite остаются в credit_transaction_ids и не переиспользуются.
+    :param session: Сессия базы данных.
+    :param transaction_ids: ID транзакций.
+    :return: Значения удаленных строк.
+    """
+    found = _locate_transactions(session, transaction_ids)
+    by_table: Dict[Table, List[Any]] = {}
+    for key, (table, _) in found.items():
+        by_table.setdefault(table, []).append(key)
+    with batched_versions(session.connection(), PARENT_TABLE):
+        for table, keys in by_table.items():
+            for batch in _batches(keys):
+                session.execute(table.delete().where(table.c.TransactionID.in_(batch)))
+    deleted = [row for _, row in found.values()]
+    record_changes(session, PARENT_TABLE, "delete", deleted, ["TransactionID"])
+    return deleted
+
+
+def migrate_existing_transactions(session: Session) -> Dict[str, int]:
+    """
+    Переносит строки из несекционированной таблицы credit_transactions SQLite в секции.
+    :param session: Сессия базы данных.
+    :return: Словарь {имя секции: количество перенесенных строк}.
+    """
+    if _is_postgres(session):
+        return {}
+    moved = _move_base_rows(session)
+    session.commit()
+    return moved
+
+
+def _move_base_rows(session: Session) -> Dict[str, int]:
+    base = CreditTransaction.__table__
+    rows = [dict(row) for row in session.execute(select(base)).mappings()]
+    if not rows:
+        return {}
+    with batched_versions(session.connection(), PARENT_TABLE):
+        _reserve_ids(session, rows)
+        moved = _route(session, rows)
+        session.execute(base.delete())
+    return moved
+
+
+def clear_partitions(session: Session):
+    """
+    Удаляет данные из всех секций (для режима replace при загрузке)
+    и записывает в журнал truncate.
+    :param session: Сессия базы данных.
+    """
+    record_change(session, PARENT_TABLE, "truncate")
+    if _is_postgres(session):
+        session.execute(CreditTransaction.__table__.delete())
+        return
+    with batched_versions(session.connection(), PARENT_TABLE):
+        for month in list_partitions(session):
+            session.execute(partition_table(month).delete())
+        if inspect(session.connection()).has_table(transaction_ids.name):
+            session.execute(transaction_ids.delete())
+
+
+def prune_partitions(
+    session: Session,
+    start: Optional[Any] = None,
+    end: Optional[Any] = None
+) -> List[date]:
+    """
+    Возвращает месяцы секций, пересекающихся с диапазоном дат [start, end].
+    :param session: Сессия базы данных.
+    :param start: Начало диапазона (включительно).
+    :param end: Конец диапазона (включительно).
+    :return: Список месяцев.
+    """
+    first = month_start(start) if start is not None else None
+    last = month_start(end) if end is not None else None
+    return [
+        month for month in list_partitions(session)
+        if (first is None or month >= first) and (last is None or month <= last)
+    ]
+
+
+def transactions_source(session: Session, date_range: Optional[Dict[str, Any]] = None):
+    """
+    Возвращает сущность для запросов к транзакциям с учетом секционирования.
+    В PostgreSQL и для несекционированной SQLite это сам CreditTransaction
+    (отсечение секций выполняет СУБД). Для SQLite с секциями — алиас CreditTransaction
+    над UNION ALL только тех секций, которые пересекаются с date_range,
+    плюс основная таблица (строки, еще не перенесенные в секции).
+    :param session: Сессия базы данных.
+    :param date_range: Словарь с ключами "start" и "end" для диапазона дат.
+    :return: CreditTransaction или его алиас.
+    """
+    if _is_postgres(session):
+        return CreditTransaction
+
+    date_range = date_range or {}
+    if not list_partitions(session):
+        return CreditTransaction
+
+    months = prune_partitions(session, date_range.get("start"), date_range.get("end"))
+    selects = [select(CreditTransaction.__table__)]
+    selects += [select(partition_table(month)) for month in months]
+    return aliased(CreditTransaction, union_all(*selects).subquery(PARENT_TABLE))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _reject_relationship_loads(orm_execute_state):
+    """
+    Запрещает загрузку связей на CreditTransaction (ленивую и selectin) в SQLite
+    с секциями: основная таблица там пуста, и связь молча вернула бы [].
+    """
+    if not orm_execute_state.is_relationship_load:
+        return
+    if orm_execute_state.bind_mapper is not CreditTransaction.__mapper__:
+        return
+    session = orm_execute_state.session
+    if _is_postgres(session) or not list_partitions(session):
+        return
+    raise ValueError(
+        f"Таблица {PARENT_TABLE} секционирована: связи с транзакциями недоступны, "
+        "используйте transactions_source (например, data_queries.get_transactions_by_customer)"
+    )
+
+
+def detach_partition(session: Session, month: Any, archive_dir: Optional[str] = None) -> str:
+    """
+    Отсоединяет секцию месяца от рабочего набора.
+    PostgreSQL: DETACH PARTITION — секция остается отдельной таблицей.
+    SQLite: секция переносится в отдельный файл базы данных в archive_dir.
+    :param session: Сессия базы данных.
+    :param month: Любая дата внутри месяца.
+    :param archive_dir: Директория для архивных файлов SQLite.
+    :return: Имя отсоединенной таблицы (PostgreSQL) или путь к архивному файлу (SQLite).
+    """
+    name = partition_name(month)
+    if _is_postgres(session):
+        # Для потребителей журнала строки секции удаляются
+        record_table_deletes(session.connection(), PARENT_TABLE, name, "TransactionID")
+        session.execute(text(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{name}"'))
+        # DETACH PARTITION не вызывает триггеры, версия увеличивается явно
+        bump_version(session.connection(), PARENT_TABLE)
+        session.commit()
+        return name
+
+    if archive_dir is None:
+        raise ValueError("Для SQLite необходимо указать директорию архива")
+    if month_start(month) not in list_partitions(session):
+        raise ValueError(f"Секция {name} не найдена")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, f"{name}.db")
+
+    # ATTACH нельзя выполнять внутри транзакции, поэтому сессия фиксируется,
+    # а архивирование выполняется в отдельном соединении
+    session.commit()
+    with session.get_bind().connect() as connection:
+        connection.exec_driver_sql("ATTACH DATABASE ? AS archive", (archive_path,))
+        try:
+            connection.exec_driver_sql(f'CREATE TABLE archive."{name}" AS SELECT * FROM main."{name}"')
+            # Журнал и версия пишутся в одной транзакции с DROP TABLE (он не вызывает триггеры)
+            record_table_deletes(connection, PARENT_TABLE, name, "TransactionID")
+            if inspect(connection).has_table(TableVersion.__tablename__):
+                bump_version(connection, PARENT_TABLE)
+            connection.exec_driver_sql(f'DROP TABLE main."{name}"')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql("DETACH DATABASE archive")
+    return archive_path
+
@@ -0,0 +1,210 @@
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+
+from database.models import Base, TableVersion
+
+# Версии таблиц для условного кэширования (ETag / Last-Modified).
+# Версии хранятся в таблице table_versions и увеличиваются триггерами БД
+# в той же транзакции, что и само изменение. Поэтому новая версия видна
+# только после коммита, откатанные изменения версию не меняют, а записи
+# из любого процесса (загрузчики, другие воркеры) учитываются одинаково.
+# Помесячные секции транзакций SQLite (credit_transactions_YYYY_MM)
+# увеличивают версию credit_transactions.
+# В SQLite триггеры построчные: каждая строка массовой загрузки добавляет
+# UPDATE table_versions (около +40% времени на 200 тыс. транзакций).
+# Поэтому массовые записи (load_csv_to_db, database/partitioning.py) выполняются
+# внутри batched_versions: триггеры снимаются в той же транзакции, а версия
+# увеличивается один раз. PostgreSQL использует триггеры уровня оператора.
+
+PARTITION_SUFFIX_RE = re.compile(r"_\d{4}_\d{2}$")
+
+# Служебные таблицы, изменения которых не влияют на ответы панели
+UNTRACKED_TABLES = {"table_versions", "change_log", "change_consumer_offsets"}
+
+TRACKED_TABLES = [name for name in Base.metadata.tables if name not in UNTRACKED_TABLES]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Ключ connection.info: таблицы, для которых триггеры сняты batched_versions
+_BATCHED = "batched_versions"
+
+_PG_FUNCTION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_versions
+    SET "Version" = "Version" + 1, "UpdatedAt" = now() AT TIME ZONE 'utc'
+    WHERE "TableName" = TG_ARGV[0];
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _trigger_names(dialect: str, table_name: str):
+    if dialect == "postgresql":
+        return [f"trg_{table_name}_version"]
+    return [f"trg_{table_name}_version_{operation}" for operation in ("insert", "update", "delete")]
+
+
+def _existing_triggers(connection) -> set:
+    if connection.dialect.name == "postgresql":
+        return set(connection.execute(text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal")).scalars())
+    return set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+
+
+def create_version_triggers(connection, table_name: str, tracked_name: Optional[str] = None):
+    """
+    Создает триггеры, увеличивающие версию таблицы при INSERT/UPDATE/DELETE.
+    :param connection: Соединение с базой данных.
+    :param table_name: Физическая таблица, на которую вешаются триггеры.
+    :param tracked_name: Имя версии в table_versions (по умолчанию — имя таблицы без суффикса секции).
+    """
+    tracked_name = tracked_name or PARTITION_SUFFIX_RE.sub("", table_name)
+    if connection.dialect.name == "postgresql":
+        # Триггер уровня оператора: одно обновление версии на любой объем изменений
+        connection.execute(text(f'DROP TRIGGER IF EXISTS "trg_{table_name}_version" ON "{table_name}"'))
+        connection.execute(text(
+            f'CREATE TRIGGER "trg_{table_name}_version" '
+            f'AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{table_name}" '
+            f"FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version('{tracked_name}')"
+        ))
+        return
+
+    # SQLite поддерживает только построчные триггеры
+    for operation in ("INSERT", "UPDATE", "DELETE"):
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS "trg_{table_name}_version_{operation.lower()}" '
+            f'AFTER {operation} ON "{table_name}" BEGIN '
+            f'UPDATE table_versions SET "Version" = "Version" + 1, "UpdatedAt" = CURRENT_TIMESTAMP '
+            f"WHERE \"TableName\" = '{tracked_name}'; END"
+        ))
+
+
+def install_version_tracking(engine):
+    """
+    Создает таблицу table_versions, ее строки и триггеры на отслеживаемых таблицах.
+    Идемпотентна: DDL выполняется только для недостающих объектов, поэтому
+    повторный вызов (например, при запуске каждого воркера панели) схему не меняет.
+    :param engine: Движок базы данных.
+    """
+    with engine.begin() as connection:
+        dialect = connection.dialect.name
+        inspector = inspect(connection)
+        if not inspector.has_table(TableVersion.__tablename__):
+            TableVersion.__table__.create(connection)
+
+        existing = set(connection.execute(select(TableVersion.TableName)).scalars())
+        missing = [name for name in TRACKED_TABLES if name not in existing]
+        if missing:
+            connection.execute(TableVersion.__table__.insert(), [
+                {"TableName": name, "Version": 0, "UpdatedAt": datetime.utcnow()} for name in missing
+            ])
+
+        existing_triggers = _existing_triggers(connection)
+        function_created = False
+        for name in inspector.get_table_names():
+            tracked_name = PARTITION_SUFFIX_RE.sub("", name)
+            if tracked_name not in TRACKED_TABLES:
+                continue
+            # В PostgreSQL секции изменяются через родительскую таблицу
+            if name != tracked_name and dialect == "postgresql":
+                continue
+            if set(_trigger_names(dialect, name)) <= existing_triggers:
+                continue
+            if dialect == "postgresql" and not function_created:
+                connection.execute(text(_PG_FUNCTION))
+                function_created = True
+            create_version_triggers(connection, name, tracked_name)
+
+
+def bump_version(connection, table_name: str):
+    """
+    Увеличивает версию таблицы в текущей транзакции (для изменений, на которые
+    не срабатывают триггеры: DROP TABLE, DETACH PARTITION, массовые записи).
+    :param connection: Соединение с базой данных.
+    :param table_name: Имя отслеживаемой таблицы.
+    """
+    connection.execute(
+        TableVersion.__table__.update()
+        .where(TableVersion.TableName == table_name)
+        .values(Version=TableVersion.Version + 1, UpdatedAt=datetime.utcnow())
+    )
+
+
+def _physical_tables(connection, table_name: str):
+    return [
+        name for name in inspect(connection).get_table_names()
+        if PARTITION_SUFFIX_RE.sub("", name) == table_name
+    ]
+
+
+def is_batched(connection, table_name: str) -> bool:
+    """
+    Проверяет, сняты ли триггеры версий таблицы через batched_versions.
+    """
+    return table_name in connection.info.get(_BATCHED, ())
+
+
+@contextmanager
+def batched_versions(connection, table_name: str):
+    """
+    Массовая запись в таблицу (и ее секции SQLite) с однократным увеличением версии.
+    SQLite: построчные триггеры версий удаляются и после записи создаются заново,
+    все в текущей транзакции — другие соединения видят только итоговое состояние,
+    а откат восстанавливает триггеры. Секции, созданные внутри блока, получают
+    триггеры при выходе. PostgreSQL: ничего не делает (триггеры уровня оператора).
+    Вложенные вызовы для той же таблицы допустимы.
+    :param connection: Соединение с базой данных (session.connection()).
+    :param table_name: Имя отслеживаемой таблицы.
+    """
+    if connection.dialect.name != "sqlite" or is_batched(connection, table_name) \
+            or not inspect(connection).has_table(TableVersion.__tablename__):
+        yield
+        return
+
+    # UPDATE — первая запись блока: pysqlite открывает транзакцию только перед DML,
+    # без нее DROP TRIGGER зафиксировался бы сразу
+    bump_version(connection, table_name)
+    for name in _physical_tables(connection, table_name):
+        for trigger in _trigger_names("sqlite", name):
+            connection.execute(text(f'DROP TRIGGER IF EXISTS "{trigger}"'))
+    connection.info.setdefault(_BATCHED, set()).add(table_name)
+    try:
+        yield
+    finally:
+        connection.info[_BATCHED].discard(table_name)
+        for name in _physical_tables(connection, table_name):
+            create_version_triggers(connection, name, table_name)
+
+
+def get_versions(connection, table_names: Iterable[str]) -> Tuple[str, datetime]:
+    """
+    Сводная версия набора таблиц (одно чтение маленькой таблицы table_versions).
+    :param connection: Соединение или сессия базы данных.
+    :param table_names: Имена таблиц.
+    :return: Кортеж (строка версии для ETag, время последнего изменения в UTC).
+    """
+    table_names = sorted(set(table_names))
+    rows = {
+        row.TableName: row
+        for row in connection.execute(
+            select(TableVersion.TableName, TableVersion.Version, TableVersion.UpdatedAt)
+            .where(TableVersion.TableName.in_(table_names))
+        )
+    }
+
+    parts = []
+    last_modified = _EPOCH
+    for name in table_names:
+        row = rows.get(name)
+        if row is None:
+            parts.append(f"{name}:0")
+            continue
+        updated_at = row.UpdatedAt.replace(tzinfo=timezone.utc, microsecond=0)
+        parts.append(f"{name}:{row.Version}:{int(updated_at.timestamp())}")
+        last_modified = max(last_modified, updated_at)
+    return ",".join(parts), last_modified
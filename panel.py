@@ -1,7 +1,9 @@
 #panel
 from flask import Flask
+from services.panel_api import register_api
 
 app = Flask(__name__)
+register_api(app)
 
 @app.route('/')
 def hello():
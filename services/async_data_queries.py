@@ -0,0 +1,232 @@
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import func
+from database.models import (
+    Customer, CreditProduct, CreditAgreement,
+    CreditTransaction, TransactionType
+)
+from database.partitioning import transactions_source
+from services.data_queries import (
+    apply_customer_filters, apply_credit_product_filters,
+    apply_transaction_filters, apply_agreement_filters
+)
+from utils.config import DB_PATH
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+
+# Асинхронные аналоги функций services/data_queries.py (SQLAlchemy asyncio).
+# Фильтры общие с синхронной версией, поэтому результаты совпадают.
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(db_url: str) -> str:
+    """
+    Преобразует URL базы данных в URL с асинхронным драйвером.
+    :param db_url: URL базы данных (например, sqlite:///bank_data.db).
+    :return: URL с драйвером aiosqlite или asyncpg.
+    """
+    scheme, rest = db_url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет асинхронного драйвера для {dialect}")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+
+
+def get_async_engine(db_url: str = DB_PATH, **kwargs):
+    """
+    Создает асинхронный движок базы данных.
+    :param db_url: URL базы данных.
+    :return: Объект AsyncEngine.
+    """
+    return create_async_engine(to_async_url(db_url), **kwargs)
+
+
+def get_async_session_factory(engine) -> Callable[[], AsyncSession]:
+    """
+    Создает фабрику асинхронных сессий.
+    :param engine: Асинхронный движок.
+    :return: Фабрика AsyncSession.
+    """
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_customers(session: AsyncSession, filters: Dict[str, Any] = None) -> List[Customer]:
+    """
+    Получение списка клиентов с возможностью фильтрации.
+    :param session: Асинхронная сессия базы данных.
+    :param filters: Словарь с фильтрами.
+    :return: Список объектов Customer.
+    """
+    result = await session.execute(apply_customer_filters(select(Customer), filters))
+    return result.scalars().all()
+
+
+async def get_credit_products(session: AsyncSession, filters: Dict[str, Any] = None) -> List[CreditProduct]:
+    """
+    Получение всех кредитных продуктов с возможностью фильтрации.
+    :param session: Асинхронная сессия базы данных.
+    :param filters: Словарь с фильтрами.
+    :return: Список объектов CreditProduct.
+    """
+    result = await session.execute(apply_credit_product_filters(select(CreditProduct), filters))
+    return result.scalars().all()
+
+
+async def get_transactions_by_customer(
+    session: AsyncSession,
+    customer_id: int,
+    transaction_type: Optional[int] = None,
+    date_range: Optional[Dict[str, str]] = None
+) -> List[CreditTransaction]:
+    """
+    Получение транзакций по ID клиента с возможностью фильтрации по типу и дате.
+    :param session: Асинхронная сессия базы данных.
+    :param customer_id: ID клиента.
+    :param transaction_type: ID типа транзакции.
+    :param date_range: Словарь с ключами "start" и "end" для диапазона дат.
+    :return: Список объектов CreditTransaction.
+    """
+    source = await session.run_sync(transactions_source, date_range)
+    query = apply_transaction_filters(
+        select(source), source, customer_id, transaction_type, date_range
+    )
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+async def get_credit_agreements_by_customer(
+    session: AsyncSession,
+    customer_id: int,
+    active_only: bool = False
+) -> List[CreditAgreement]:
+    """
+    Получение кредитных договоров клиента с возможностью фильтрации только активных.
+    :param session: Асинхронная сессия базы данных.
+    :param customer_id: ID клиента.
+    :param active_only: Возвращать только активные договоры.
+    :return: Список объектов CreditAgreement.
+    """
+    result = await session.execute(
+        apply_agreement_filters(select(CreditAgreement), customer_id, active_only)
+    )
+    return result.scalars().all()
+
+
+async def get_aggregated_transaction_summary(
+    session: AsyncSession,
+    customer_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Получение агрегированных данных по транзакциям (сумма, среднее, количество).
+    :param session: Асинхронная сессия базы данных.
+    :param customer_id: ID клиента (опционально).
+    :return: Словарь с агрегированными данными.
+    """
+    source = await session.run_sync(transactions_source)
+    query = select(
+        func.sum(source.TransactionAmount).label("total_amount"),
+        func.avg(source.TransactionAmount).label("average_amount"),
+        func.count(source.TransactionID).label("transaction_count")
+    )
+    if customer_id:
+        query = query.filter(source.CustomerID == customer_id)
+    result = (await session.execute(query)).one()
+    return {
+        "total_amount": result.total_amount,
+        "average_amount": result.average_amount,
+        "transaction_count": result.transaction_count
+    }
+
+
+async def get_top_customers_by_loans(
+    session: AsyncSession,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Получение топ клиентов по сумме кредитов.
+    :param session: Асинхронная сессия базы данных.
+    :param limit: Максимальное количество клиентов в результате.
+    :return: Список словарей с данными о клиентах.
+    """
+    query = select(
+        Customer.Name,
+        func.sum(CreditAgreement.LoanAmount).label("total_loans")
+    ).join(CreditAgreement, CreditAgreement.CustomerID == Customer.CustomerID) \
+        .group_by(Customer.CustomerID) \
+        .order_by(func.sum(CreditAgreement.LoanAmount).desc()) \
+        .limit(limit)
+
+    result = await session.execute(query)
+    return [{"Name": row.Name, "TotalLoans": row.total_loans} for row in result.all()]
+
+
+async def get_transaction_types(session: AsyncSession) -> List[TransactionType]:
+    """
+    Получение всех типов транзакций.
+    :param session: Асинхронная сессия базы данных.
+    :return: Список объектов TransactionType.
+    """
+    result = await session.execute(select(TransactionType))
+    return result.scalars().all()
+
+
+async def get_credit_products_with_active_agreements(session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Получение кредитных продуктов с количеством активных соглашений.
+    :param session: Асинхронная сессия базы данных.
+    :return: Список словарей с данными о продуктах.
+    """
+    query = select(
+        CreditProduct.ProductName,
+        func.count(CreditAgreement.CreditAgreementID).label("active_agreements")
+    ).join(CreditAgreement, CreditAgreement.CreditProductID == CreditProduct.CreditProductID) \
+        .filter(CreditAgreement.IsActive == True) \
+        .group_by(CreditProduct.ProductName)
+
+    result = await session.execute(query)
+    return [{"ProductName": row.ProductName, "ActiveAgreements": row.active_agreements} for row in result.all()]
+
+
+async def gather_queries(
+    session_factory: Callable[[], AsyncSession],
+    queries: Dict[str, Callable[[AsyncSession], Awaitable[Any]]]
+) -> Dict[str, Any]:
+    """
+    Выполняет независимые запросы параллельно, каждый в своей сессии
+    (AsyncSession нельзя использовать из нескольких задач одновременно).
+    :param session_factory: Фабрика асинхронных сессий.
+    :param queries: Словарь {имя: функция, принимающая сессию и возвращающая корутину}.
+    :return: Словарь {имя: результат запроса}.
+    """
+    async def run(query):
+        async with session_factory() as session:
+            return await query(session)
+
+    results = await asyncio.gather(*(run(query) for query in queries.values()))
+    return dict(zip(queries.keys(), results))
+
+
+async def get_customer_card(
+    session_factory: Callable[[], AsyncSession],
+    customer_id: int,
+    date_range: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Карточка клиента: договоры, транзакции и сводка, загружаемые параллельно.
+    :param session_factory: Фабрика асинхронных сессий.
+    :param customer_id: ID клиента.
+    :param date_range: Словарь с ключами "start" и "end" для диапазона дат транзакций.
+    :return: Словарь с ключами "agreements", "transactions", "summary".
+    """
+    return await gather_queries(session_factory, {
+        "agreements": lambda session: get_credit_agreements_by_customer(session, customer_id),
+        "transactions": lambda session: get_transactions_by_customer(
+            session, customer_id, date_range=date_range
+        ),
+        "summary": lambda session: get_aggregated_transaction_summary(session, customer_id),
+    })
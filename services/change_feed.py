@@ -0,0 +1,127 @@
+import json
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database.models import ChangeLog, ChangeConsumerOffset
+from typing import List, Dict, Any, Optional, Iterator, Sequence
+
+# Потребители читают журнал по возрастанию ChangeID и сохраняют последнее смещение.
+# ChangeID не переиспользуются (AUTOINCREMENT в SQLite), а в PostgreSQL запись
+# в журнал сериализуется advisory-блокировкой до коммита (см. database.models),
+# поэтому изменение с меньшим ChangeID не может зафиксироваться после большего.
+
+
+def _change_to_dict(change: ChangeLog) -> Dict[str, Any]:
+    return {
+        "ChangeID": change.ChangeID,
+        "TableName": change.TableName,
+        "Operation": change.Operation,
+        "PrimaryKey": json.loads(change.PrimaryKey) if change.PrimaryKey else None,
+        "Payload": json.loads(change.Payload) if change.Payload else None,
+        "ChangedAt": change.ChangedAt,
+    }
+
+
+def get_changes(
+    session: Session,
+    after_id: int = 0,
+    limit: int = 1000,
+    tables: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Получение порции изменений из журнала начиная после указанного смещения.
+    :param session: Сессия базы данных.
+    :param after_id: Смещение — ChangeID последнего обработанного изменения.
+    :param limit: Максимальный размер порции.
+    :param tables: Имена таблиц для фильтрации (опционально).
+    :return: Список словарей с изменениями, упорядоченных по ChangeID.
+    """
+    query = session.query(ChangeLog).filter(ChangeLog.ChangeID > after_id)
+    if tables:
+        query = query.filter(ChangeLog.TableName.in_(tables))
+    query = query.order_by(ChangeLog.ChangeID).limit(limit)
+    return [_change_to_dict(change) for change in query.all()]
+
+
+def iter_changes(
+    session: Session,
+    after_id: int = 0,
+    batch_size: int = 1000,
+    tables: Optional[Sequence[str]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Последовательно возвращает порции изменений до конца журнала.
+    :param session: Сессия базы данных.
+    :param after_id: Смещение, после которого начинать чтение.
+    :param batch_size: Размер порции.
+    :param tables: Имена таблиц для фильтрации (опционально).
+    :return: Итератор по порциям изменений.
+    """
+    while True:
+        batch = get_changes(session, after_id, batch_size, tables)
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1]["ChangeID"]
+
+
+def get_consumer_offset(session: Session, consumer_name: str) -> int:
+    """
+    Получение сохраненного смещения потребителя.
+    :param session: Сессия базы данных.
+    :param consumer_name: Имя потребителя.
+    :return: ChangeID последнего подтвержденного изменения (0, если потребитель новый).
+    """
+    offset = session.query(ChangeConsumerOffset).get(consumer_name)
+    return offset.LastChangeID if offset else 0
+
+
+def commit_consumer_offset(session: Session, consumer_name: str, change_id: int):
+    """
+    Сохраняет смещение потребителя после обработки порции изменений.
+    :param session: Сессия базы данных.
+    :param consumer_name: Имя потребителя.
+    :param change_id: ChangeID последнего обработанного изменения.
+    """
+    offset = session.query(ChangeConsumerOffset).get(consumer_name)
+    if offset:
+        offset.LastChangeID = change_id
+        offset.UpdatedAt = datetime.utcnow()
+    else:
+        session.add(ChangeConsumerOffset(ConsumerName=consumer_name, LastChangeID=change_id))
+    session.commit()
+
+
+def poll_changes(
+    session: Session,
+    consumer_name: str,
+    batch_size: int = 1000,
+    tables: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Получение следующей порции изменений для потребителя по его сохраненному смещению.
+    После обработки порции вызовите commit_consumer_offset с ChangeID последнего изменения.
+    :param session: Сессия базы данных.
+    :param consumer_name: Имя потребителя.
+    :param batch_size: Размер порции.
+    :param tables: Имена таблиц для фильтрации (опционально).
+    :return: Список словарей с изменениями.
+    """
+    return get_changes(session, get_consumer_offset(session, consumer_name), batch_size, tables)
+
+
+def purge_changes(session: Session, up_to_id: Optional[int] = None) -> int:
+    """
+    Удаляет из журнала изменения, уже подтвержденные всеми потребителями.
+    :param session: Сессия базы данных.
+    :param up_to_id: Удалить изменения с ChangeID <= up_to_id
+                     (по умолчанию — минимальное смещение среди потребителей).
+    :return: Количество удаленных записей.
+    """
+    if up_to_id is None:
+        offsets = [offset.LastChangeID for offset in session.query(ChangeConsumerOffset).all()]
+        if not offsets:
+            return 0
+        up_to_id = min(offsets)
+    deleted = session.query(ChangeLog).filter(ChangeLog.ChangeID <= up_to_id).delete()
+    session.commit()
+    return deleted
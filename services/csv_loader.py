@@ -1,7 +1,12 @@
 import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from database.models import Customer, CreditProduct, CreditAgreement, TransactionType, CreditTransaction
+from database.models import (
+    Customer, CreditProduct, CreditAgreement, TransactionType, CreditTransaction,
+    record_change, record_changes
+)
+from database import partitioning, versions
+from utils.config import PARTITION_TRANSACTIONS
 from datetime import datetime
 
 
@@ -22,18 +27,32 @@ def load_csv_to_db(
     """
     try:
         data = pd.read_csv(csv_file)
+        partitioned = model == CreditTransaction and PARTITION_TRANSACTIONS
 
         # Если нужно, очищаем таблицу перед загрузкой
         if replace:
             session.query(model).delete()
+            if partitioned:
+                partitioning.clear_partitions(session)
+            else:
+                record_change(session, model.__tablename__, "truncate")
             session.commit()
 
         # Валидация данных перед загрузкой
         if validate:
             data = validate_data(data, model)
 
-        # Загрузка данных в базу
-        session.bulk_insert_mappings(model, data.to_dict(orient="records"))
+        # Загрузка данных в базу (транзакции при секционировании раскладываются по месяцам)
+        # Версия таблицы увеличивается один раз на загрузку, а не триггером на каждую строку.
+        # В журнал пишутся фактически вставленные ключи: return_defaults возвращает
+        # автоинкрементные ID в records, insert_transactions пишет журнал сам
+        records = data.to_dict(orient="records")
+        with versions.batched_versions(session.connection(), model.__tablename__):
+            if partitioned:
+                partitioning.insert_transactions(session, records)
+            else:
+                session.bulk_insert_mappings(model, records, return_defaults=True)
+                record_changes(session, model.__tablename__, "insert", records, _primary_key(model))
         session.commit()
         print(f"Данные из {csv_file} успешно загружены в таблицу {model.__tablename__}.")
 
@@ -46,6 +65,13 @@ def load_csv_to_db(
         print(f"Произошла ошибка при загрузке {csv_file}: {e}")
 
 
+def _primary_key(model):
+    """
+    Имена колонок первичного ключа модели.
+    """
+    return list(model.__table__.primary_key.columns.keys())
+
+
 def validate_data(data: pd.DataFrame, model):
     """
     Валидирует данные перед загрузкой.
@@ -84,8 +110,11 @@ def export_table_to_csv(session: Session, model, csv_file: str):
     :param csv_file: Путь к файлу CSV для сохранения.
     """
     try:
-        # Получаем данные из таблицы
-        data = session.query(model).all()
+        # Получаем данные из таблицы (для транзакций — вместе с секциями)
+        if model == CreditTransaction:
+            data = session.query(partitioning.transactions_source(session)).all()
+        else:
+            data = session.query(model).all()
 
         # Преобразуем данные в DataFrame
         df = pd.DataFrame([row.__dict__ for row in data])
@@ -122,6 +151,14 @@ def update_data_from_csv(session: Session, model, csv_file: str):
     """
     try:
         data = pd.read_csv(csv_file)
+        if model == CreditTransaction and PARTITION_TRANSACTIONS:
+            # Строки транзакций находятся в секциях, а не в основной таблице
+            updated, inserted = partitioning.update_transactions(session, data.to_dict(orient="records"))
+            session.commit()
+            print(f"Данные из {csv_file} успешно обновлены в таблице {model.__tablename__}: "
+                  f"обновлено {len(updated)}, добавлено {len(inserted)}.")
+            return
+
         for index, row in data.iterrows():
             # Ищем запись по первичному ключу
             primary_key = list(model.__table__.primary_key.columns.keys())[0]
@@ -132,9 +169,11 @@ def update_data_from_csv(session: Session, model, csv_file: str):
                 for key, value in row.items():
                     if hasattr(record, key):
                         setattr(record, key, value)
+                record_changes(session, model.__tablename__, "update", [row.to_dict()], [primary_key])
             else:
                 # Добавляем новую запись, если не найдено
                 session.add(model(**row.to_dict()))
+                record_changes(session, model.__tablename__, "insert", [row.to_dict()], [primary_key])
 
         session.commit()
         print(f"Данные из {csv_file} успешно обновлены в таблице {model.__tablename__}.")
@@ -154,13 +193,20 @@ def delete_data_from_csv(session: Session, model, csv_file: str):
         data = pd.read_csv(csv_file)
         primary_key = list(model.__table__.primary_key.columns.keys())[0]
 
-        for value in data[primary_key]:
-            record = session.query(model).get(value)
-            if record:
-                session.delete(record)
+        if model == CreditTransaction and PARTITION_TRANSACTIONS:
+            deleted = partitioning.delete_transactions(session, data[primary_key].tolist())
+        else:
+            deleted = []
+            for value in data[primary_key]:
+                record = session.query(model).get(value)
+                if record:
+                    session.delete(record)
+                    deleted.append({primary_key: value})
+            record_changes(session, model.__tablename__, "delete", deleted, [primary_key])
 
         session.commit()
-        print(f"Данные из {csv_file} успешно удалены из таблицы {model.__tablename__}.")
+        print(f"Из таблицы {model.__tablename__} удалено записей: {len(deleted)} "
+              f"(в {csv_file} указано {len(data)}).")
     except Exception as e:
         session.rollback()
         print(f"Произошла ошибка при удалении данных из {csv_file}: {e}")
@@ -4,6 +4,7 @@ from database.models import (
     Customer, CreditProduct, CreditAgreement,
     CreditTransaction, TransactionType
 )
+from database.partitioning import transactions_source
 from typing import List, Dict, Any, Optional
 
 
@@ -14,15 +15,7 @@ def get_customers(session: Session, filters: Dict[str, Any] = None) -> List[Cust
     :param filters: Словарь с фильтрами.
     :return: Список объектов Customer.
     """
-    query = session.query(Customer)
-    if filters:
-        if "CustomerTypeID" in filters:
-            query = query.filter(Customer.CustomerTypeID == filters["CustomerTypeID"])
-        if "Name" in filters:
-            query = query.filter(Customer.Name.like(f"%{filters['Name']}%"))
-        if "TIN" in filters:
-            query = query.filter(Customer.TIN == filters["TIN"])
-    return query.all()
+    return apply_customer_filters(session.query(Customer), filters).all()
 
 
 def get_credit_products(session: Session, filters: Dict[str, Any] = None) -> List[CreditProduct]:
@@ -32,15 +25,7 @@ def get_credit_products(session: Session, filters: Dict[str, Any] = None) -> Lis
     :param filters: Словарь с фильтрами.
     :return: Список объектов CreditProduct.
     """
-    query = session.query(CreditProduct)
-    if filters:
-        if "MaxLoanAmount" in filters:
-            query = query.filter(CreditProduct.MaxLoanAmount >= filters["MaxLoanAmount"])
-        if "InterestRate" in filters:
-            query = query.filter(CreditProduct.InterestRate <= filters["InterestRate"])
-        if "CollateralRequired" in filters:
-            query = query.filter(CreditProduct.CollateralRequired == filters["CollateralRequired"])
-    return query.all()
+    return apply_credit_product_filters(session.query(CreditProduct), filters).all()
 
 
 def get_transactions_by_customer(
@@ -57,16 +42,11 @@ def get_transactions_by_customer(
     :param date_range: Словарь с ключами "start" и "end" для диапазона дат.
     :return: Список объектов CreditTransaction.
     """
-    query = session.query(CreditTransaction).filter(
-        CreditTransaction.CustomerID == customer_id
+    # Читаем только секции, пересекающиеся с диапазоном дат
+    source = transactions_source(session, date_range)
+    query = apply_transaction_filters(
+        session.query(source), source, customer_id, transaction_type, date_range
     )
-    if transaction_type:
-        query = query.filter(CreditTransaction.TransactionTypeID == transaction_type)
-    if date_range:
-        if "start" in date_range:
-            query = query.filter(CreditTransaction.TransactionDate >= date_range["start"])
-        if "end" in date_range:
-            query = query.filter(CreditTransaction.TransactionDate <= date_range["end"])
     return query.all()
 
 
@@ -82,12 +62,7 @@ def get_credit_agreements_by_customer(
     :param active_only: Возвращать только активные договоры.
     :return: Список объектов CreditAgreement.
     """
-    query = session.query(CreditAgreement).filter(
-        CreditAgreement.CustomerID == customer_id
-    )
-    if active_only:
-        query = query.filter(CreditAgreement.IsActive == True)
-    return query.all()
+    return apply_agreement_filters(session.query(CreditAgreement), customer_id, active_only).all()
 
 
 def get_aggregated_transaction_summary(
@@ -100,13 +75,14 @@ def get_aggregated_transaction_summary(
     :param customer_id: ID клиента (опционально).
     :return: Словарь с агрегированными данными.
     """
+    source = transactions_source(session)
     query = session.query(
-        func.sum(CreditTransaction.TransactionAmount).label("total_amount"),
-        func.avg(CreditTransaction.TransactionAmount).label("average_amount"),
-        func.count(CreditTransaction.TransactionID).label("transaction_count")
+        func.sum(source.TransactionAmount).label("total_amount"),
+        func.avg(source.TransactionAmount).label("average_amount"),
+        func.count(source.TransactionID).label("transaction_count")
     )
     if customer_id:
-        query = query.filter(CreditTransaction.CustomerID == customer_id)
+        query = query.filter(source.CustomerID == customer_id)
     result = query.one()
     return {
         "total_amount": result.total_amount,
@@ -159,3 +135,134 @@ def get_credit_products_with_active_agreements(session: Session) -> List[Dict[st
         .group_by(CreditProduct.ProductName)
 
     return [{"ProductName": row.ProductName, "ActiveAgreements": row.active_agreements} for row in query.all()]
+
+
+def get_top_rated_products(
+    session: Session,
+    limit: int = 10,
+    min_ratings: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Получение кредитных продуктов с наивысшим средним рейтингом.
+    Использует поддерживаемые агрегаты CreditProduct, без обращения к product_ratings.
+    :param session: Сессия базы данных.
+    :param limit: Максимальное количество продуктов в результате.
+    :param min_ratings: Минимальное количество оценок у продукта.
+    :return: Список словарей с данными о продуктах.
+    """
+    average = (CreditProduct.RatingSum * 1.0 / CreditProduct.RatingCount).label("average_rating")
+    query = session.query(
+        CreditProduct.CreditProductID,
+        CreditProduct.ProductName,
+        CreditProduct.RatingCount,
+        average
+    ).filter(CreditProduct.RatingCount >= max(min_ratings, 1)) \
+        .order_by(average.desc(), CreditProduct.RatingCount.desc()) \
+        .limit(limit)
+
+    return [
+        {
+            "CreditProductID": row.CreditProductID,
+            "ProductName": row.ProductName,
+            "RatingCount": row.RatingCount,
+            "AverageRating": row.average_rating
+        }
+        for row in query.all()
+    ]
+
+
+def get_product_rating_summary(session: Session, credit_product_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Получение сводки рейтингов продукта (количество, среднее, гистограмма оценок).
+    :param session: Сессия базы данных.
+    :param credit_product_id: ID кредитного продукта.
+    :return: Словарь со сводкой или None, если продукт не найден.
+    """
+    product = session.query(CreditProduct).get(credit_product_id)
+    if not product:
+        return None
+    return {
+        "CreditProductID": product.CreditProductID,
+        "RatingCount": product.RatingCount,
+        "AverageRating": product.AverageRating,
+        "Histogram": product.RatingHistogram
+    }
+
+
+# Построение фильтров. Работают и с Query (синхронная сессия), и с select()
+# (асинхронная сессия, см. services/async_data_queries.py), чтобы семантика совпадала.
+def apply_customer_filters(query, filters: Dict[str, Any] = None):
+    """
+    Применяет фильтры клиентов к запросу.
+    :param query: Query или Select по Customer.
+    :param filters: Словарь с фильтрами.
+    :return: Отфильтрованный запрос.
+    """
+    if filters:
+        if "CustomerTypeID" in filters:
+            query = query.filter(Customer.CustomerTypeID == filters["CustomerTypeID"])
+        if "Name" in filters:
+            query = query.filter(Customer.Name.like(f"%{filters['Name']}%"))
+        if "TIN" in filters:
+            query = query.filter(Customer.TIN == filters["TIN"])
+    return query
+
+
+def apply_credit_product_filters(query, filters: Dict[str, Any] = None):
+    """
+    Применяет фильтры кредитных продуктов к запросу.
+    :param query: Query или Select по CreditProduct.
+    :param filters: Словарь с фильтрами.
+    :return: Отфильтрованный запрос.
+    """
+    if filters:
+        if "MaxLoanAmount" in filters:
+            query = query.filter(CreditProduct.MaxLoanAmount >= filters["MaxLoanAmount"])
+        if "InterestRate" in filters:
+            query = query.filter(CreditProduct.InterestRate <= filters["InterestRate"])
+        if "CollateralRequired" in filters:
+            query = query.filter(CreditProduct.CollateralRequired == filters["CollateralRequired"])
+    return query
+
+
+def apply_transaction_filters(
+    query,
+    source,
+    customer_id: Optional[int],
+    transaction_type: Optional[int] = None,
+    date_range: Optional[Dict[str, str]] = None
+):
+    """
+    Применяет фильтры транзакций к запросу.
+    :param query: Query или Select по source.
+    :param source: CreditTransaction или его алиас над секциями.
+    :param customer_id: ID клиента (None — все клиенты).
+    :param transaction_type: ID типа транзакции.
+    :param date_range: Словарь с ключами "start" и "end" для диапазона дат.
+    :return: Отфильтрованный запрос.
+    """
+    if customer_id is not None:
+        query = query.filter(source.CustomerID == customer_id)
+    if transaction_type:
+        query = query.filter(source.TransactionTypeID == transaction_type)
+    if date_range:
+        if "start" in date_range:
+            query = query.filter(source.TransactionDate >= date_range["start"])
+        if "end" in date_range:
+            query = query.filter(source.TransactionDate <= date_range["end"])
+    return query
+
+
+def apply_agreement_filters(query, customer_id: Optional[int], active_only: bool = False):
+    """
+    Применяет фильтры кредитных договоров к запросу.
+    :param query: Query или Select по CreditAgreement.
+    :param customer_id: ID клиента (None — все клиенты).
+    :param active_only: Оставить только активные договоры.
+    :return: Отфильтрованный запрос.
+    """
+    if customer_id is not None:
+        query = query.filter(CreditAgreement.CustomerID == customer_id)
+    if active_only:
+        query = query.filter(CreditAgreement.IsActive == True)
+    return query
@@ -0,0 +1,241 @@
+import json
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, request, jsonify, abort
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from database import versions
+from database.models import Customer, CreditProduct, CreditAgreement, CreditTransaction
+from database.partitioning import transactions_source, to_date
+from services.data_queries import (
+    apply_customer_filters, apply_agreement_filters, apply_transaction_filters,
+    get_aggregated_transaction_summary, get_top_customers_by_loans,
+    get_credit_products_with_active_agreements
+)
+from utils.config import DB_PATH
+
+# REST API панели поверх services/data_queries.py.
+# Списки отдаются построчно в формате NDJSON прямо из курсора БД,
+# постраничный обход — по ключу (?after=<последний ID>&limit=N).
+# Ответы снабжаются ETag/Last-Modified по версиям таблиц (database/versions.py):
+# повторный запрос без изменений получает 304 после чтения одной строки
+# table_versions на таблицу, без выполнения самого запроса.
+# Подключается к приложению через register_api(app, engine).
+
+STREAM_BATCH_SIZE = 1000
+MAX_LIMIT = 100000
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+def register_api(app, engine=None):
+    """
+    Подключает API панели к приложению Flask.
+    :param app: Приложение Flask.
+    :param engine: Движок базы данных (по умолчанию создается по app.config["DATABASE_URL"] или DB_PATH).
+    """
+    if engine is None:
+        engine = create_engine(app.config.get("DATABASE_URL", DB_PATH))
+    # Версии увеличиваются триггерами БД, поэтому учитываются записи из любых процессов;
+    # если триггеры уже установлены, DDL не выполняется
+    versions.install_version_tracking(engine)
+    app.extensions["panel_api"] = {"engine": engine, "sessionmaker": sessionmaker(bind=engine)}
+    app.register_blueprint(api)
+
+
+def _engine():
+    return current_app.extensions["panel_api"]["engine"]
+
+
+def _session_factory():
+    return current_app.extensions["panel_api"]["sessionmaker"]
+
+
+def _not_modified(tables):
+    """
+    Вычисляет ETag и Last-Modified для набора таблиц.
+    :param tables: Имена таблиц, от которых зависит ответ.
+    :return: Кортеж (ответ 304 или None, etag, last_modified).
+    """
+    with _engine().connect() as connection:
+        version, last_modified = versions.get_versions(connection, tables)
+    etag = f"{version}?{request.query_string.decode()}"
+    # Время изменения хранится с точностью до секунды: пока секунда не закончилась,
+    # в ней может быть зафиксировано еще одно изменение с тем же Last-Modified.
+    # Такое значение не отдается клиенту и не используется для 304 (остается ETag).
+    if last_modified >= datetime.now(timezone.utc).replace(microsecond=0):
+        last_modified = None
+    if etag in request.if_none_match:
+        return Response(status=304), etag, last_modified
+    if not request.if_none_match and request.if_modified_since and last_modified is not None \
+            and last_modified <= request.if_modified_since:
+        return Response(status=304), etag, last_modified
+    return None, etag, last_modified
+
+
+def _conditional(response: Response, etag: str, last_modified) -> Response:
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def _int_arg(name: str, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, description=f"Параметр {name} должен быть целым числом")
+
+
+def _date_arg(name: str):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return to_date(value)
+    except ValueError:
+        abort(400, description=f"Параметр {name} должен быть датой в формате YYYY-MM-DD")
+
+
+def _stream_ndjson(build_query, session_factory):
+    """
+    Генератор NDJSON-строк. Сессия открывается только при чтении тела ответа,
+    строки читаются из курсора порциями по STREAM_BATCH_SIZE.
+    :param build_query: Функция, принимающая сессию и возвращающая select().
+    :param session_factory: Фабрика сессий (контекст приложения при чтении тела уже недоступен).
+    """
+    session = session_factory()
+    try:
+        result = session.execute(
+            build_query(session).execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE)
+        )
+        for row in result.mappings():
+            yield json.dumps(dict(row), default=str, ensure_ascii=False) + "\n"
+    finally:
+        session.close()
+
+
+def _page_args():
+    """
+    Читает курсор ?after= и ограничение ?limit= (до начала потоковой выдачи).
+    """
+    return _int_arg("after"), _int_arg("limit")
+
+
+def _keyset(query, key_column, page):
+    """
+    Применяет курсор и ограничение к запросу с сортировкой по ключу.
+    """
+    after, limit = page
+    if after is not None:
+        query = query.filter(key_column > after)
+    query = query.order_by(key_column)
+    if limit is not None:
+        query = query.limit(max(1, min(limit, MAX_LIMIT)))
+    return query
+
+
+def _ndjson_response(tables, build_query):
+    not_modified, etag, last_modified = _not_modified(tables)
+    if not_modified is not None:
+        return _conditional(not_modified, etag, last_modified)
+    response = Response(_stream_ndjson(build_query, _session_factory()), mimetype="application/x-ndjson")
+    return _conditional(response, etag, last_modified)
+
+
+def _json_response(tables, load):
+    not_modified, etag, last_modified = _not_modified(tables)
+    if not_modified is not None:
+        return _conditional(not_modified, etag, last_modified)
+    session = _session_factory()()
+    try:
+        response = jsonify(load(session))
+    finally:
+        session.close()
+    return _conditional(response, etag, last_modified)
+
+
+def _columns(entity):
+    return [getattr(entity, column.name) for column in entity.__table__.columns]
+
+
+# Клиенты: ?CustomerTypeID=&Name=&TIN=&after=&limit=
+@api.route("/customers")
+def customers():
+    page = _page_args()
+    filters = {}
+    if "CustomerTypeID" in request.args:
+        filters["CustomerTypeID"] = _int_arg("CustomerTypeID")
+    for key in ("Name", "TIN"):
+        if key in request.args:
+            filters[key] = request.args[key]
+
+    def build_query(session):
+        query = apply_customer_filters(select(*_columns(Customer)), filters)
+        return _keyset(query, Customer.CustomerID, page)
+
+    return _ndjson_response([Customer.__tablename__], build_query)
+
+
+# Кредитные договоры: ?customer_id=&active_only=1&after=&limit=
+@api.route("/agreements")
+def agreements():
+    page = _page_args()
+    customer_id = _int_arg("customer_id")
+    active_only = request.args.get("active_only") in ("1", "true")
+
+    def build_query(session):
+        query = apply_agreement_filters(select(*_columns(CreditAgreement)), customer_id, active_only)
+        return _keyset(query, CreditAgreement.CreditAgreementID, page)
+
+    return _ndjson_response([CreditAgreement.__tablename__], build_query)
+
+
+# Транзакции: ?customer_id=&transaction_type=&start=&end=&after=&limit=
+@api.route("/transactions")
+def transactions():
+    page = _page_args()
+    customer_id = _int_arg("customer_id")
+    transaction_type = _int_arg("transaction_type")
+    date_range = {key: _date_arg(key) for key in ("start", "end") if key in request.args}
+
+    def build_query(session):
+        source = transactions_source(session, date_range)
+        columns = [getattr(source, column.name) for column in CreditTransaction.__table__.columns]
+        query = apply_transaction_filters(
+            select(*columns), source, customer_id, transaction_type, date_range
+        )
+        return _keyset(query, source.TransactionID, page)
+
+    return _ndjson_response([CreditTransaction.__tablename__], build_query)
+
+
+# Сводка по транзакциям: ?customer_id=
+@api.route("/aggregates/summary")
+def transaction_summary():
+    customer_id = _int_arg("customer_id")
+    return _json_response(
+        [CreditTransaction.__tablename__],
+        lambda session: get_aggregated_transaction_summary(session, customer_id)
+    )
+
+
+# Топ клиентов по сумме кредитов: ?limit=
+@api.route("/aggregates/top-customers")
+def top_customers():
+    limit = _int_arg("limit", 10)
+    return _json_response(
+        [Customer.__tablename__, CreditAgreement.__tablename__],
+        lambda session: get_top_customers_by_loans(session, limit)
+    )
+
+
+# Кредитные продукты с количеством активных договоров
+@api.route("/aggregates/active-products")
+def active_products():
+    return _json_response(
+        [CreditProduct.__tablename__, CreditAgreement.__tablename__],
+        get_credit_products_with_active_agreements
+    )
@@ -0,0 +1,503 @@
+import json
+import os
+import shutil
+import time
+import zlib
+from datetime import datetime
+import numpy as np
+from sqlalchemy import Boolean, Date, Float, Integer, select
+from sqlalchemy.orm import Session
+from database.models import Customer, CreditAgreement, CreditTransaction, ChangeLog
+from database.partitioning import transactions_source
+from utils.config import SNAPSHOT_DIR
+from typing import List, Dict, Any, Optional
+
+# Колоночный снимок хранилища в файлах NumPy (.npy), открываемых через mmap.
+# Файлы только читаются, поэтому страницы разделяются между процессами-воркерами
+# через кэш ОС. Рядом с колонками хранятся индексы:
+#   - хеш-таблица с открытой адресацией по TIN клиента;
+#   - CSR-индексы (offsets + index) клиент -> договоры и договор -> транзакции.
+# Обновление по журналу изменений работает на уровне таблиц, а не строк:
+# изменившаяся таблица перестраивается целиком, вместе с зависящими от нее
+# индексами (INDEX_SOURCES); индексы неизменившихся таблиц берутся из
+# предыдущего поколения.
+# Каждая перестройка пишет новое поколение в отдельную директорию и атомарно
+# переключает manifest.json. Предыдущее поколение сохраняется (его пути
+# записаны в манифесте), более старые удаляются не раньше чем через
+# SNAPSHOT_GRACE_SECONDS: воркер, прочитавший старый манифест, успевает
+# открыть его файлы, а Snapshot.reload при пропавшем файле перечитывает манифест.
+# Уже отображенные (mmap) файлы после удаления остаются доступными только в POSIX.
+
+MANIFEST_FILE = "manifest.json"
+
+SNAPSHOT_TABLES = {
+    Customer.__tablename__: (Customer, "CustomerID"),
+    CreditAgreement.__tablename__: (CreditAgreement, "CreditAgreementID"),
+    CreditTransaction.__tablename__: (CreditTransaction, "TransactionID"),
+}
+
+FETCH_BATCH_SIZE = 10000
+
+# Таблицы, по которым строится каждый индекс
+INDEX_SOURCES = {
+    "tin_hash": [Customer.__tablename__],
+    "customer_agreements": [Customer.__tablename__, CreditAgreement.__tablename__],
+    "agreement_transactions": [CreditAgreement.__tablename__, CreditTransaction.__tablename__],
+}
+
+# Минимальный возраст устаревшего поколения перед удалением (в секундах)
+SNAPSHOT_GRACE_SECONDS = 300
+
+# Попытки открыть снимок, если поколение удалили во время Snapshot.reload
+RELOAD_ATTEMPTS = 3
+
+
+def _column_kind(column) -> str:
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, Float):
+        return "float"
+    if isinstance(column.type, Date):
+        return "date"
+    return "str"
+
+
+def _save(path: str, array: np.ndarray):
+    np.save(path, np.ascontiguousarray(array))
+
+
+def _load(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode="r")
+
+
+def _write_column(prefix: str, kind: str, values: List[Any]) -> bool:
+    """
+    Записывает колонку в файлы .npy. Строки хранятся как байты UTF-8 + смещения.
+    :return: True, если в колонке есть NULL (записана маска null).
+    """
+    nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    has_nulls = bool(nulls.any())
+    if has_nulls:
+        _save(f"{prefix}.null.npy", nulls)
+
+    if kind == "str":
+        encoded = [(value or "").encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        _save(f"{prefix}.offsets.npy", offsets)
+        _save(f"{prefix}.data.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    elif kind == "date":
+        _save(f"{prefix}.npy", np.array(values, dtype="datetime64[D]"))
+    elif kind == "bool":
+        _save(f"{prefix}.npy", np.array([bool(value) for value in values], dtype=bool))
+    elif kind == "int":
+        _save(f"{prefix}.npy", np.array([value or 0 for value in values], dtype=np.int64))
+    else:
+        _save(f"{prefix}.npy", np.array([np.nan if value is None else value for value in values], dtype=np.float64))
+    return has_nulls
+
+
+def _read_table(session: Session, table_name: str):
+    """
+    Читает таблицу из БД по возрастанию первичного ключа.
+    :return: Словарь {колонка: список значений}.
+    """
+    model, key = SNAPSHOT_TABLES[table_name]
+    source = transactions_source(session) if model is CreditTransaction else model
+    names = [column.name for column in model.__table__.columns]
+    query = select(*[getattr(source, name) for name in names]).order_by(getattr(source, key))
+
+    data = {name: [] for name in names}
+    result = session.execute(query.execution_options(yield_per=FETCH_BATCH_SIZE))
+    for row in result:
+        for name, value in zip(names, row):
+            data[name].append(value)
+    return data
+
+
+def _write_table(session: Session, snapshot_dir: str, table_name: str, generation: int) -> Dict[str, Any]:
+    model, key = SNAPSHOT_TABLES[table_name]
+    relative = os.path.join(table_name, str(generation))
+    path = os.path.join(snapshot_dir, relative)
+    os.makedirs(path, exist_ok=True)
+
+    data = _read_table(session, table_name)
+    columns = {}
+    for column in model.__table__.columns:
+        kind = _column_kind(column)
+        has_nulls = _write_column(os.path.join(path, column.name), kind, data[column.name])
+        columns[column.name] = {"kind": kind, "nulls": has_nulls}
+    return {"path": relative, "rows": len(data[key]), "key": key, "columns": columns}
+
+
+def _build_hash_index(data: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Хеш-таблица с открытой адресацией (линейное пробирование, заполнение <= 50%).
+    Слот хранит номер строки или -1.
+    """
+    rows = len(offsets) - 1
+    size = 1 << max(3, (2 * rows).bit_length())
+    mask = size - 1
+    slots = np.full(size, -1, dtype=np.int64)
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    for row in range(rows):
+        slot = zlib.crc32(raw[bounds[row]:bounds[row + 1]]) & mask
+        while slots[slot] != -1:
+            slot = (slot + 1) & mask
+        slots[slot] = row
+    return slots
+
+
+def _build_csr(parent_keys: np.ndarray, child_keys: np.ndarray):
+    """
+    CSR-индекс родитель -> потомки: строки потомков родителя i —
+    index[offsets[i]:offsets[i + 1]]. parent_keys отсортированы по возрастанию.
+    """
+    parents = len(parent_keys)
+    positions = np.searchsorted(parent_keys, child_keys)
+    if parents:
+        valid = positions < parents
+        valid[valid] = parent_keys[positions[valid]] == child_keys[valid]
+    else:
+        valid = np.zeros(len(child_keys), dtype=bool)
+    child_rows = np.nonzero(valid)[0]
+    positions = positions[valid]
+
+    order = np.argsort(positions, kind="stable")
+    offsets = np.zeros(parents + 1, dtype=np.int64)
+    np.cumsum(np.bincount(positions, minlength=parents), out=offsets[1:])
+    return offsets, child_rows[order].astype(np.int64)
+
+
+def _index_paths(manifest: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Директории индексов манифеста: {имя индекса: путь}.
+    В манифестах старого формата все индексы лежат в одной директории.
+    """
+    indexes = manifest["indexes"]
+    if isinstance(indexes, str):
+        return {name: indexes for name in INDEX_SOURCES}
+    return indexes
+
+
+def _write_indexes(
+    snapshot_dir: str,
+    tables: Dict[str, Any],
+    generation: int,
+    rebuilt: List[str],
+    previous: Optional[Dict[str, Any]] = None
+) -> Dict[str, str]:
+    """
+    Строит индексы, исходные таблицы которых перестроены; остальные индексы
+    переиспользуются из предыдущего манифеста.
+    :return: Словарь {имя индекса: директория относительно snapshot_dir}.
+    """
+    previous_paths = _index_paths(previous) if previous else {}
+    stale = [
+        name for name, sources in INDEX_SOURCES.items()
+        if name not in previous_paths or set(sources) & set(rebuilt)
+    ]
+    paths = {name: path for name, path in previous_paths.items() if name in INDEX_SOURCES and name not in stale}
+    if not stale:
+        return paths
+
+    relative = os.path.join("indexes", str(generation))
+    path = os.path.join(snapshot_dir, relative)
+    os.makedirs(path, exist_ok=True)
+
+    def column(table_name, name, suffix=""):
+        return _load(os.path.join(snapshot_dir, tables[table_name]["path"], f"{name}{suffix}.npy"))
+
+    customers = Customer.__tablename__
+    agreements = CreditAgreement.__tablename__
+    transactions = CreditTransaction.__tablename__
+
+    if "tin_hash" in stale:
+        _save(os.path.join(path, "tin_hash.npy"), _build_hash_index(
+            column(customers, "TIN", ".data"), column(customers, "TIN", ".offsets")
+        ))
+
+    if "customer_agreements" in stale:
+        offsets, index = _build_csr(column(customers, "CustomerID"), column(agreements, "CustomerID"))
+        _save(os.path.join(path, "customer_agreements.offsets.npy"), offsets)
+        _save(os.path.join(path, "customer_agreements.index.npy"), index)
+
+    if "agreement_transactions" in stale:
+        offsets, index = _build_csr(
+            column(agreements, "CreditAgreementID"), column(transactions, "CreditAgreementID")
+        )
+        _save(os.path.join(path, "agreement_transactions.offsets.npy"), offsets)
+        _save(os.path.join(path, "agreement_transactions.index.npy"), index)
+
+    paths.update({name: relative for name in stale})
+    return paths
+
+
+def read_manifest(snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Читает manifest.json снимка.
+    :param snapshot_dir: Директория снимка.
+    :return: Словарь манифеста или None, если снимок еще не построен.
+    """
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(snapshot_dir: str, manifest: Dict[str, Any]):
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _generation_paths(manifest: Optional[Dict[str, Any]]) -> List[str]:
+    if manifest is None:
+        return []
+    paths = [table["path"] for table in manifest["tables"].values()]
+    return paths + sorted(set(_index_paths(manifest).values()))
+
+
+def _remove_stale_generations(snapshot_dir: str, manifest: Dict[str, Any],
+                              grace_seconds: float = SNAPSHOT_GRACE_SECONDS):
+    """
+    Удаляет поколения, не входящие ни в текущий, ни в предыдущий манифест
+    и созданные раньше чем grace_seconds назад.
+    """
+    kept = {os.path.normpath(path) for path in _generation_paths(manifest) + manifest.get("previous", [])}
+    deadline = time.time() - grace_seconds
+    for group in list(SNAPSHOT_TABLES) + ["indexes"]:
+        group_dir = os.path.join(snapshot_dir, group)
+        if not os.path.isdir(group_dir):
+            continue
+        for generation in os.listdir(group_dir):
+            path = os.path.join(group_dir, generation)
+            if os.path.normpath(os.path.join(group, generation)) in kept:
+                continue
+            try:
+                if os.path.getmtime(path) > deadline:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _last_change_id(session: Session) -> int:
+    return session.query(ChangeLog.ChangeID).order_by(ChangeLog.ChangeID.desc()).limit(1).scalar() or 0
+
+
+def build_snapshot(session: Session, snapshot_dir: str = SNAPSHOT_DIR, tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Строит (или частично перестраивает) снимок таблиц и индексов.
+    Таблицы из tables перестраиваются целиком, индексы — только зависящие от них.
+    :param session: Сессия базы данных.
+    :param snapshot_dir: Директория снимка.
+    :param tables: Таблицы для перестройки (по умолчанию — все; остальные берутся из текущего снимка).
+    :return: Новый манифест.
+    """
+    previous = read_manifest(snapshot_dir)
+    if previous is None or tables is None:
+        tables = list(SNAPSHOT_TABLES)
+
+    generation = (previous["generation"] + 1) if previous else 1
+    # Смещение журнала фиксируем до чтения таблиц: изменения, попавшие между
+    # чтением смещения и таблиц, будут повторно учтены при следующем обновлении
+    last_change_id = _last_change_id(session)
+
+    manifest_tables = dict(previous["tables"]) if previous else {}
+    for table_name in tables:
+        manifest_tables[table_name] = _write_table(session, snapshot_dir, table_name, generation)
+
+    manifest = {
+        "generation": generation,
+        "built_at": datetime.utcnow().isoformat(),
+        "last_change_id": last_change_id,
+        "tables": manifest_tables,
+        "indexes": _write_indexes(snapshot_dir, manifest_tables, generation, tables, previous),
+        # Файлы предыдущего поколения нужны воркерам, еще не переключившимся на новый манифест
+        "previous": _generation_paths(previous),
+    }
+    _write_manifest(snapshot_dir, manifest)
+    _remove_stale_generations(snapshot_dir, manifest)
+    return manifest
+
+
+def refresh_snapshot(session: Session, snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет снимок по журналу изменений (change_log): определяет таблицы,
+    изменившиеся после построения снимка, и перестраивает их целиком (гранулярность —
+    таблица, а не строка) вместе с зависящими от них индексами.
+    :param session: Сессия базы данных.
+    :param snapshot_dir: Директория снимка.
+    :return: Новый манифест или None, если изменений нет.
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return build_snapshot(session, snapshot_dir)
+
+    changed = session.query(ChangeLog.TableName).filter(
+        ChangeLog.ChangeID > manifest["last_change_id"],
+        ChangeLog.TableName.in_(list(SNAPSHOT_TABLES))
+    ).distinct().all()
+    if not changed:
+        return None
+    return build_snapshot(session, snapshot_dir, [row.TableName for row in changed])
+
+
+class Snapshot:
+    """
+    Доступ только для чтения к снимку, открытому через mmap.
+    Несколько процессов могут открывать один снимок одновременно.
+    """
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.manifest = None
+        self._columns = {}
+        self.reload()
+
+    def reload(self):
+        """
+        Открывает текущее поколение снимка. Если файлы поколения удалены
+        во время открытия, перечитывает манифест (до RELOAD_ATTEMPTS попыток).
+        """
+        for attempt in range(RELOAD_ATTEMPTS):
+            manifest = read_manifest(self.snapshot_dir)
+            if manifest is None:
+                raise ValueError(f"Снимок в {self.snapshot_dir} не найден")
+            try:
+                self._open(manifest)
+                return
+            except FileNotFoundError:
+                if attempt == RELOAD_ATTEMPTS - 1:
+                    raise
+
+    def _open(self, manifest: Dict[str, Any]):
+        columns = {}
+        for table_name, table in manifest["tables"].items():
+            path = os.path.join(self.snapshot_dir, table["path"])
+            table_columns = {}
+            for name, meta in table["columns"].items():
+                prefix = os.path.join(path, name)
+                if meta["kind"] == "str":
+                    values = (_load(f"{prefix}.data.npy"), _load(f"{prefix}.offsets.npy"))
+                else:
+                    values = _load(f"{prefix}.npy")
+                nulls = _load(f"{prefix}.null.npy") if meta["nulls"] else None
+                table_columns[name] = (meta["kind"], values, nulls)
+            columns[table_name] = table_columns
+
+        indexes = {
+            name: os.path.join(self.snapshot_dir, path) for name, path in _index_paths(manifest).items()
+        }
+        tin_hash = _load(os.path.join(indexes["tin_hash"], "tin_hash.npy"))
+        customer_agreements = (
+            _load(os.path.join(indexes["customer_agreements"], "customer_agreements.offsets.npy")),
+            _load(os.path.join(indexes["customer_agreements"], "customer_agreements.index.npy")),
+        )
+        agreement_transactions = (
+            _load(os.path.join(indexes["agreement_transactions"], "agreement_transactions.offsets.npy")),
+            _load(os.path.join(indexes["agreement_transactions"], "agreement_transactions.index.npy")),
+        )
+        # Состояние меняется только после успешного открытия всех файлов
+        self._tin_hash = tin_hash
+        self._customer_agreements = customer_agreements
+        self._agreement_transactions = agreement_transactions
+        self._columns = columns
+        self.manifest = manifest
+
+    def reload_if_changed(self) -> bool:
+        """
+        Переоткрывает снимок, если было построено новое поколение.
+        :return: True, если снимок был переоткрыт.
+        """
+        manifest = read_manifest(self.snapshot_dir)
+        if manifest is None or manifest["generation"] == self.manifest["generation"]:
+            return False
+        self.reload()
+        return True
+
+    def _value(self, table_name: str, name: str, row: int):
+        kind, values, nulls = self._columns[table_name][name]
+        if nulls is not None and nulls[row]:
+            return None
+        if kind == "str":
+            data, offsets = values
+            return bytes(data[offsets[row]:offsets[row + 1]]).decode("utf-8")
+        if kind == "date":
+            return values[row].astype(object)
+        return values[row].item()
+
+    def _row(self, table_name: str, row: int) -> Dict[str, Any]:
+        return {name: self._value(table_name, name, row) for name in self._columns[table_name]}
+
+    def _find_row(self, table_name: str, key_value: int) -> Optional[int]:
+        key = self.manifest["tables"][table_name]["key"]
+        keys = self._columns[table_name][key][1]
+        row = int(np.searchsorted(keys, key_value))
+        if row < len(keys) and keys[row] == key_value:
+            return row
+        return None
+
+    def _children(self, csr, parent_row: Optional[int], table_name: str) -> List[Dict[str, Any]]:
+        if parent_row is None:
+            return []
+        offsets, index = csr
+        return [self._row(table_name, int(row)) for row in index[offsets[parent_row]:offsets[parent_row + 1]]]
+
+    def get_customer_by_tin(self, tin: str) -> Optional[Dict[str, Any]]:
+        """
+        Поиск клиента по ИНН через хеш-индекс.
+        :param tin: ИНН клиента.
+        :return: Словарь с данными клиента или None.
+        """
+        key = tin.encode("utf-8")
+        data, offsets = self._columns[Customer.__tablename__]["TIN"][1]
+        slots = self._tin_hash
+        mask = len(slots) - 1
+        slot = zlib.crc32(key) & mask
+        while slots[slot] != -1:
+            row = int(slots[slot])
+            if bytes(data[offsets[row]:offsets[row + 1]]) == key:
+                return self._row(Customer.__tablename__, row)
+            slot = (slot + 1) & mask
+        return None
+
+    def get_customer(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Поиск клиента по ID.
+        :param customer_id: ID клиента.
+        :return: Словарь с данными клиента или None.
+        """
+        row = self._find_row(Customer.__tablename__, customer_id)
+        return None if row is None else self._row(Customer.__tablename__, row)
+
+    def get_credit_agreements_by_customer(self, customer_id: int) -> List[Dict[str, Any]]:
+        """
+        Кредитные договоры клиента (CSR-индекс клиент -> договоры).
+        :param customer_id: ID клиента.
+        :return: Список словарей с данными договоров.
+        """
+        return self._children(
+            self._customer_agreements,
+            self._find_row(Customer.__tablename__, customer_id),
+            CreditAgreement.__tablename__
+        )
+
+    def get_transactions_by_agreement(self, credit_agreement_id: int) -> List[Dict[str, Any]]:
+        """
+        Транзакции по договору (CSR-индекс договор -> транзакции).
+        :param credit_agreement_id: ID кредитного договора.
+        :return: Список словарей с данными транзакций.
+        """
+        return self._children(
+            self._agreement_transactions,
+            self._find_row(CreditAgreement.__tablename__, credit_agreement_id),
+            CreditTransaction.__tablename__
+        )
@@ -3,3 +3,9 @@ import os
 # Настройки пути базы данных
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = f"sqlite:///{os.path.join(BASE_DIR, '../bank_data.db')}"
+
+# Помесячное секционирование таблицы credit_transactions (1 — включено)
+PARTITION_TRANSACTIONS = os.environ.get("PARTITION_TRANSACTIONS", "0") == "1"
+
+# Директория колоночного снимка (services/snapshot.py)
+SNAPSHOT_DIR = os.path.join(BASE_DIR, '../snapshot')